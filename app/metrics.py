@@ -0,0 +1,487 @@
+import asyncio
+import atexit
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import orjson
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Seconds, from cache hits to the crawl of a long video.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 60, 300)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        pairs.append(f'{name}="{value}"')
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_metric(name: str, kind: str, help: str, samples):
+    """
+    Return the lines of a metric in the Prometheus text format. `samples`
+    are `(suffix, label names, label values, value)`.
+    """
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+    for suffix, names, values, value in samples:
+        # Counts stay integers, where `:g` would round large ones.
+        value = value if isinstance(value, int) else repr(float(value))
+        lines.append(f"{name}{suffix}{format_labels(names, values)} {value}")
+
+    return lines
+
+
+# Metrics included in the snapshots of each process, see `SharedMetrics`.
+REGISTRY = []
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        self._lock = threading.Lock()
+        self._values = {}
+
+        REGISTRY.append(self)
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(v), value] for v, value in self._values.items()]
+
+    def collect(self, snapshots):
+        """Return the lines of the sum of the `snapshots` of all processes."""
+        totals = {}
+
+        for snapshot, _ in snapshots:
+            for values, value in snapshot.get(self.name, ()):
+                values = tuple(values)
+                totals[values] = totals.get(values, 0) + value
+
+        return format_metric(
+            self.name,
+            "counter",
+            self.help,
+            [("", self.labels, v, value) for v, value in sorted(totals.items())],
+        )
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+
+        self._lock = threading.Lock()
+        # Label values to the counts per bucket, the last one for +Inf, and
+        # the sum.
+        self._series = {}
+
+        REGISTRY.append(self)
+
+    def observe(self, *values, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(values)
+
+            if series is None:
+                series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            series[0][i] += 1
+            series[1] += value
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(v), list(c), s] for v, (c, s) in self._series.items()]
+
+    def collect(self, snapshots):
+        """Return the lines of the sum of the `snapshots` of all processes."""
+        merged = {}
+
+        for snapshot, _ in snapshots:
+            for values, counts, total in snapshot.get(self.name, ()):
+                values = tuple(values)
+                series = merged.setdefault(values, [[0] * len(counts), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+
+        labels = (*self.labels, "le")
+        samples = []
+
+        for values, (counts, total) in sorted(merged.items()):
+            count = 0
+            for le, n in zip((*self.buckets, "+Inf"), counts):
+                count += n
+                samples.append(("_bucket", labels, (*values, le), count))
+
+            samples.append(("_sum", self.labels, values, total))
+            samples.append(("_count", self.labels, values, count))
+
+        return format_metric(self.name, "histogram", self.help, samples)
+
+
+class Callback:
+    """
+    A metric kept by another object, read with `read` when the metrics are
+    collected. `read` returns the value, or a dict of them by label values
+    with `labels`. Over processes, the values are combined with `merge`: of
+    all processes for counters, and of the running ones for gauges, such as
+    the crawls in flight.
+    """
+
+    def __init__(self, name: str, kind: str, help: str, read, labels=(), merge=sum):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.read = read
+        self.labels = labels
+        self.merge = merge
+
+        REGISTRY.append(self)
+
+    def reset(self):
+        pass
+
+    def snapshot(self):
+        values = self.read()
+
+        if not self.labels:
+            values = {(): values}
+
+        return [[list(v), value] for v, value in values.items() if value is not None]
+
+    def collect(self, snapshots):
+        """Return the lines of the `snapshots` of all processes, merged."""
+        merged = {}
+
+        for snapshot, live in snapshots:
+            if self.kind == "gauge" and not live:
+                continue
+
+            for values, value in snapshot.get(self.name, ()):
+                merged.setdefault(tuple(values), []).append(value)
+
+        return format_metric(
+            self.name,
+            self.kind,
+            self.help,
+            [("", self.labels, v, self.merge(vs)) for v, vs in sorted(merged.items())],
+        )
+
+
+requests_total = Counter(
+    "highlighter_requests_total",
+    "Requests by route, method and status.",
+    ("route", "method", "status"),
+)
+request_seconds = Histogram(
+    "highlighter_request_duration_seconds",
+    "Time to respond to a request, by route.",
+    DURATION_BUCKETS,
+    ("route",),
+)
+request_queries = Histogram(
+    "highlighter_request_db_queries",
+    "Database queries made by a request, by route.",
+    QUERY_BUCKETS,
+    ("route",),
+)
+stage_seconds = Histogram(
+    "highlighter_stage_duration_seconds",
+    "Time spent in a stage of handling a request, by stage. Stages may "
+    "contain others, such as the duration lookup of a crawl.",
+    DURATION_BUCKETS,
+    ("stage",),
+)
+
+
+class RequestMetrics:
+    """The stages, in seconds, and the database queries of a request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+        self.query_time = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def track_request():
+    """
+    Collect the stages and queries of the code run in this context, which
+    includes `sync_to_async` calls but not other threads.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current request."""
+    st = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - st
+        stage_seconds.observe(name, value=elapsed)
+        shared.start()
+
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.stages[name] = metrics.stages.get(name, 0.0) + elapsed
+
+
+def timed(name: str):
+    """Decorator timing each call of a function or coroutine as `stage`."""
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with stage(name):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_queries(execute, sql, params, many, context):
+    metrics = _current.get()
+
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    st = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_time += time.perf_counter() - st
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def install_query_counter():
+    """Count the queries of requests on every database connection."""
+    connection_created.connect(
+        _install_query_counter, dispatch_uid="app.metrics.count_queries"
+    )
+
+    # Connections are per thread, so this only covers those opened so far
+    # by this one.
+    for connection in connections.all():
+        _install_query_counter(None, connection)
+
+
+def record_request(request, response, metrics: RequestMetrics):
+    """
+    Record a finished request, and print it as one JSON line if
+    `HIGHLIGHTER_REQUEST_LOG` is set. Requests no view matched, such as
+    static files, are counted but not printed.
+    """
+    elapsed = metrics.elapsed
+    match = getattr(request, "resolver_match", None)
+    shared.start()
+    route = match.route if match is not None else ""
+
+    requests_total.inc(route, request.method, response.status_code)
+    request_seconds.observe(route, value=elapsed)
+    request_queries.observe(route, value=metrics.queries)
+
+    if not settings.HIGHLIGHTER_REQUEST_LOG or match is None:
+        return
+
+    entry = {
+        "method": request.method,
+        "route": route,
+        "path": request.path,
+        "status": response.status_code,
+        "time_ms": round(elapsed * 1e3, 1),
+        "db_queries": metrics.queries,
+        "db_ms": round(metrics.query_time * 1e3, 1),
+        "stages": {k: round(v * 1e3, 1) for k, v in metrics.stages.items()},
+    }
+    print(f"[Request] {orjson.dumps(entry).decode()}")
+
+
+def _reset_after_fork():
+    # The counts of the parent, such as the gunicorn master, are in its own
+    # snapshot already. Locks held by its other threads are not released in
+    # the child, so they are replaced as well.
+    for metric in REGISTRY:
+        metric.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hit_counts(stats):
+    """The `hits` and `misses` of the `stats()` of a cache, by result."""
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+
+class SharedMetrics:
+    """
+    Shares the metrics of the processes of a server, such as the gunicorn
+    workers and the crawl worker, through a snapshot file per process in
+    `root`. Each process writes its own every `interval` seconds and when it
+    exits, so any of them can serve the metrics of all. A process that has
+    not written for three intervals is taken as stopped: its counts stay in
+    the totals, but its gauges are left out. Without a `root`, only the
+    metrics of the current process are served.
+    """
+
+    def __init__(self, root, interval: float):
+        self.root = Path(root) if root else None
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def path(self) -> Path:
+        return self.root / f"{os.getpid()}.json"
+
+    def start(self):
+        """Start writing the snapshots of this process, once per process."""
+        if self.root is None or self._pid == os.getpid():
+            return
+
+        with self._lock:
+            # The writer of a forked parent does not run in the child.
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        threading.Thread(target=self._run, name="metrics", daemon=True).start()
+        atexit.register(self._flush)
+
+    def write(self):
+        path = self.path
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+
+        tmp.write_bytes(orjson.dumps(snapshot()))
+        os.replace(tmp, path)
+
+    def read(self):
+        """
+        Return the snapshots of all processes, with whether each is still
+        running, the current one first.
+        """
+        snapshots = [(snapshot(), True)]
+
+        if self.root is None:
+            return snapshots
+
+        deadline = time.time() - 3 * self.interval
+
+        for path in self.root.glob("*.json"):
+            if path == self.path:
+                continue
+
+            try:
+                snapshots.append(
+                    (orjson.loads(path.read_bytes()), path.stat().st_mtime >= deadline)
+                )
+            except (OSError, ValueError):
+                # Removed or replaced meanwhile.
+                continue
+
+        return snapshots
+
+    def clear(self):
+        """Remove the snapshots of the processes of a previous run."""
+        if self.root is None:
+            return
+
+        for path in self.root.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+    def _flush(self):
+        try:
+            self.write()
+        except OSError as e:
+            print(f"[Metrics] {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._flush()
+
+
+shared = SharedMetrics(
+    settings.HIGHLIGHTER_METRICS_DIR, settings.HIGHLIGHTER_METRICS_INTERVAL
+)
+
+
+def snapshot():
+    """Return the values of the metrics of this process by name."""
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def collect():
+    """Return the lines of the metrics of all processes sharing them."""
+    snapshots = shared.read()
+    lines = []
+
+    for metric in REGISTRY:
+        lines += metric.collect(snapshots)
+
+    return lines
@@ -0,0 +1,127 @@
+import asyncio
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from whitenoise import middleware
+
+from app import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_br = re.compile(r"\bbr\b")
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware that also runs in the async request path under
+    ASGI. Django runs the whole request in a single thread for a sync-only
+    middleware, which would serialize the async views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Make Django treat this instance as a coroutine function.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+
+        if response is None:
+            response = await self.get_response(request)
+
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Times each request and counts its database queries for `/metrics`, with
+    the stages timed by `app.metrics.stage` along the way. Runs first, so the
+    time includes the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.install_query_counter()
+
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Make Django treat this instance as a coroutine function.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        with metrics.track_request() as tracked:
+            response = self.get_response(request)
+
+        metrics.record_request(request, response, tracked)
+        return response
+
+    async def __acall__(self, request):
+        with metrics.track_request() as tracked:
+            response = await self.get_response(request)
+
+        metrics.record_request(request, response, tracked)
+        return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses of at least `HIGHLIGHTER_COMPRESS_MIN_SIZE` bytes,
+    such as batch responses, with brotli if it is installed and accepted by
+    the client, or with gzip otherwise.
+    """
+
+    def process_response(self, request, response):
+        if (
+            not response.streaming
+            and len(response.content) < settings.HIGHLIGHTER_COMPRESS_MIN_SIZE
+        ):
+            return response
+
+        ae = request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+        if brotli is None or response.streaming or not re_accepts_br.search(ae):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        if response.has_header("Content-Encoding"):
+            return response
+
+        compressed = brotli.compress(
+            response.content, quality=settings.HIGHLIGHTER_BROTLI_QUALITY
+        )
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+
+        # Same as GZipMiddleware: the compressed body is only weakly equal.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+
+        response["Content-Encoding"] = "br"
+        return response
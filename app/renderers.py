@@ -1,7 +1,16 @@
+import orjson
 from rest_framework import renderers
 
+from app import metrics
+
 
 class JSONRenderer(renderers.JSONRenderer):
+    """
+    Renders compact JSON with orjson. Pretty printing is only done when it is
+    asked for, with `Accept: application/json; indent=2` or by the browsable
+    API.
+    """
+
     def get_indent(self, accepted_media_type, renderer_context):
         if accepted_media_type:
             # If the media type looks like 'application/json; indent=4',
@@ -17,4 +26,28 @@ class JSONRenderer(renderers.JSONRenderer):
 
         # If 'indent' is provided in the context, then pretty print the result.
         # E.g. If we're being called by the BrowsableAPIRenderer.
-        return renderer_context.get("indent", 2)
+        return renderer_context.get("indent", None)
+
+    @metrics.timed("render")
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if indent is None:
+            option = 0
+        elif indent == 2:
+            option = orjson.OPT_INDENT_2
+        else:
+            # orjson only indents by 2.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Leave the types orjson formats differently, such as datetimes, to
+        # the encoder of REST framework.
+        return orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=option | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
@@ -52,14 +52,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "app.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "app.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "app.middleware.WhiteNoiseMiddleware",
 ]
 
 ROOT_URLCONF = "app.urls"
@@ -184,5 +186,148 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": datetime.timedelta(days=28),
 }
 
+# Highlighter
+
+TWITCH_CLIENT_ID = os.getenv("twitch_id")
+TWITCH_CLIENT_SECRET = os.getenv("twitch_secret")
+TWITCH_API_URL = os.getenv("TWITCH_API_URL", "https://api.twitch.tv")
+
+# Refresh the Twitch app access token this long before it expires.
+HIGHLIGHTER_TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=30)
+
+# Bump together with the highlighter-core pin in requirements.txt so cached
+# results computed by an older model are invalidated.
+HIGHLIGHTER_MODEL_VERSION = os.getenv("HIGHLIGHTER_MODEL_VERSION", "86bed63")
+# Bump when the ranges kept of the predictions change, such as how
+# overlapping ones are dropped, to invalidate cached results the same way.
+HIGHLIGHTER_SELECTION_VERSION = 2
+# Version cached results are stored under.
+HIGHLIGHTER_RESULT_VERSION = (
+    f"{HIGHLIGHTER_MODEL_VERSION}.{HIGHLIGHTER_SELECTION_VERSION}"
+)
+
+HIGHLIGHTER_MAX_LIMIT = 10
+
+# Longer videos are rejected, and remembered as such for a day.
+HIGHLIGHTER_MAX_DURATION = int(os.getenv("HIGHLIGHTER_MAX_DURATION", 24 * 60 * 60))
+
+# Longer videos are crawled into the chat store segment by segment and
+# predicted in windows of this many seconds, each overlapping the next, so
+# memory and time grow linearly with the duration. Videos up to the former
+# 5 hour limit are predicted in one pass.
+HIGHLIGHTER_PREDICT_WINDOW = 5 * 60 * 60
+HIGHLIGHTER_PREDICT_WINDOW_OVERLAP = 10 * 60
+# Predicted ranges that overlap a more probable range by more than this share
+# of the shorter one are dropped.
+HIGHLIGHTER_RANGE_MAX_OVERLAP = 0.5
+HIGHLIGHTER_UNSUPPORTED_TTL = datetime.timedelta(days=1)
+
+HIGHLIGHTER_BATCH_MAX = int(os.getenv("HIGHLIGHTER_BATCH_MAX", 50))
+
+HIGHLIGHTER_RESULT_CACHE_SIZE = int(os.getenv("HIGHLIGHTER_RESULT_CACHE_SIZE", 5000))
+
+# Cache lifetime of the shared highlight ranges in browsers and CDNs, which
+# keep them per credential (Vary: Authorization, Cookie).
+HIGHLIGHTER_RANGES_MAX_AGE = int(os.getenv("HIGHLIGHTER_RANGES_MAX_AGE", 60 * 60))
+HIGHLIGHTER_RANGES_S_MAXAGE = int(
+    os.getenv("HIGHLIGHTER_RANGES_S_MAXAGE", 24 * 60 * 60)
+)
+HIGHLIGHTER_ETAG_CACHE_SIZE = 10000
+
+# The highlighter endpoints trust the user id of a token, and only read
+# whether the user is still active once per user in this many seconds; 0
+# skips the check.
+HIGHLIGHTER_AUTH_STATUS_TTL = int(os.getenv("HIGHLIGHTER_AUTH_STATUS_TTL", 60))
+HIGHLIGHTER_AUTH_STATUS_CACHE_SIZE = 10000
+
+# Issue compact highlight ids instead of JWTs; both are accepted for votes.
+HIGHLIGHTER_COMPACT_IDS = os.getenv("HIGHLIGHTER_COMPACT_IDS", "1") == "1"
+
+# Compress larger responses, with brotli if the package is installed.
+HIGHLIGHTER_COMPRESS_MIN_SIZE = int(os.getenv("HIGHLIGHTER_COMPRESS_MIN_SIZE", 1024))
+HIGHLIGHTER_BROTLI_QUALITY = 5
+
+HIGHLIGHTER_CHAT_STORE_DIR = os.getenv(
+    "HIGHLIGHTER_CHAT_STORE_DIR", os.path.join(BASE_DIR, "chatlogs")
+)
+HIGHLIGHTER_CHAT_STORE_SIZE = int(
+    os.getenv("HIGHLIGHTER_CHAT_STORE_SIZE", 1024 * 1024 * 1024)
+)
+# Uncompressed logs are memory-mapped, so loading one does not copy its
+# columns into memory first. "lz4" or "zstd" store 2-4x smaller files, but
+# every load decompresses the whole log into memory.
+HIGHLIGHTER_CHAT_STORE_COMPRESSION = os.getenv(
+    "HIGHLIGHTER_CHAT_STORE_COMPRESSION", "uncompressed"
+)
+# Hold chats with int32 millisecond offsets and categorical users and
+# messages instead of a Python string per chat. The predictor is given float
+# seconds and object columns, one window at a time.
+HIGHLIGHTER_COMPACT_CHATS = os.getenv("HIGHLIGHTER_COMPACT_CHATS", "1") == "1"
+
+# Crawl uncached videos in `manage.py crawlworker` instead of the request thread.
+HIGHLIGHTER_CRAWL_ASYNC = os.getenv("HIGHLIGHTER_CRAWL_ASYNC", "1") == "1"
+HIGHLIGHTER_CRAWL_CONCURRENCY = int(os.getenv("HIGHLIGHTER_CRAWL_CONCURRENCY", 2))
+HIGHLIGHTER_CRAWL_JOB_TIMEOUT = datetime.timedelta(minutes=30)
+# Jobs put back this many times, while their video was being crawled
+# elsewhere or after their worker died, fail instead.
+HIGHLIGHTER_CRAWL_MAX_ATTEMPTS = int(os.getenv("HIGHLIGHTER_CRAWL_MAX_ATTEMPTS", 5))
+# Seconds clients are asked to wait, with Retry-After, before polling an
+# unfinished job again.
+HIGHLIGHTER_JOB_POLL_INTERVAL = 2
+
+# Seconds to wait for a crawl of the same video running elsewhere.
+HIGHLIGHTER_CRAWL_WAIT_TIMEOUT = int(os.getenv("HIGHLIGHTER_CRAWL_WAIT_TIMEOUT", 30))
+HIGHLIGHTER_CRAWL_LOCK_TTL = datetime.timedelta(minutes=15)
+
+# Chats are crawled in segments of seconds. With streaming, partial highlights
+# are stored at most every interval seconds while the crawl is running.
+HIGHLIGHTER_CRAWL_STREAMING = os.getenv("HIGHLIGHTER_CRAWL_STREAMING", "0") == "1"
+HIGHLIGHTER_CRAWL_SEGMENT = int(os.getenv("HIGHLIGHTER_CRAWL_SEGMENT", 10 * 60))
+HIGHLIGHTER_PARTIAL_INTERVAL = float(os.getenv("HIGHLIGHTER_PARTIAL_INTERVAL", 10))
+
+# Bounds of the in-flight Twitch requests shared by the crawls of a process.
+HIGHLIGHTER_CRAWL_REQUESTS_MIN = int(os.getenv("HIGHLIGHTER_CRAWL_REQUESTS_MIN", 2))
+HIGHLIGHTER_CRAWL_REQUESTS_MAX = int(os.getenv("HIGHLIGHTER_CRAWL_REQUESTS_MAX", 20))
+HIGHLIGHTER_CRAWL_RETRIES = 4
+
+# The async endpoint keeps cold requests open while their videos are crawled.
+HIGHLIGHTER_ASYNC_WAIT_TIMEOUT = int(os.getenv("HIGHLIGHTER_ASYNC_WAIT_TIMEOUT", 600))
+HIGHLIGHTER_PREDICT_WORKERS = int(os.getenv("HIGHLIGHTER_PREDICT_WORKERS", 2))
+
+# Channels whose new videos `manage.py prefetch` crawls before anyone asks.
+HIGHLIGHTER_PREFETCH_CHANNELS = [
+    c for c in os.getenv("HIGHLIGHTER_PREFETCH_CHANNELS", "").split(",") if c
+]
+HIGHLIGHTER_PREFETCH_SINCE = datetime.timedelta(hours=48)
+HIGHLIGHTER_PREFETCH_MAX_PENDING = int(
+    os.getenv("HIGHLIGHTER_PREFETCH_MAX_PENDING", 20)
+)
+
+# Buffer votes in memory and write them in batches every interval seconds.
+HIGHLIGHTER_VOTE_BUFFER = os.getenv("HIGHLIGHTER_VOTE_BUFFER", "0") == "1"
+HIGHLIGHTER_VOTE_FLUSH_INTERVAL = float(
+    os.getenv("HIGHLIGHTER_VOTE_FLUSH_INTERVAL", 0.3)
+)
+
+# Highlights are ranked by probability plus this weight times the community
+# score of the range, from -1 to 1, aggregated by `manage.py aggregate_votes`;
+# 0 ranks by probability alone. The prior is the number of evenly split votes
+# a range is assumed to have had.
+HIGHLIGHTER_VOTE_WEIGHT = float(os.getenv("HIGHLIGHTER_VOTE_WEIGHT", 0.2))
+HIGHLIGHTER_VOTE_PRIOR = 5
+
+# Print one JSON line per request with its time, queries and stages.
+HIGHLIGHTER_REQUEST_LOG = os.getenv("HIGHLIGHTER_REQUEST_LOG", "1") == "1"
+# Bearer token Prometheus scrapes `/metrics` with. Without one, the endpoint
+# is only served with DEBUG.
+HIGHLIGHTER_METRICS_TOKEN = os.getenv("HIGHLIGHTER_METRICS_TOKEN")
+# Directory the processes of the server write their metrics to every
+# interval (in seconds), so that `/metrics` serves the totals of all of them.
+# Cleared when gunicorn starts. Empty to serve those of the scraped process.
+HIGHLIGHTER_METRICS_DIR = os.getenv(
+    "HIGHLIGHTER_METRICS_DIR", os.path.join(BASE_DIR, "metrics")
+)
+HIGHLIGHTER_METRICS_INTERVAL = 5
+
 db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES["default"].update(db_from_env)
@@ -24,6 +24,7 @@ from rest_framework import permissions
 
 from app.settings import DEBUG
 from app.views import Http404
+from highlighter_api.views import metrics_view
 
 handler404 = Http404
 handler500 = rest_framework.exceptions.server_error
@@ -58,6 +59,7 @@ urlpatterns = [
         TemplateView.as_view(template_name="robots.txt", content_type="text/plain"),
     ),
     path("highlighter/", include("highlighter_api.urls")),
+    path("metrics", metrics_view),
     path("", include("mgauth.urls")),
     path("accounts/", include("rest_framework.urls", namespace="rest_framework")),
     path(
@@ -0,0 +1,71 @@
+import gc
+import os
+import resource
+import time
+
+# Load the model once in the master and share it with the forked workers.
+# Set HIGHLIGHTER_PRELOAD=0 to load it in every worker instead.
+preload_app = os.getenv("HIGHLIGHTER_PRELOAD", "1") == "1"
+
+_started = time.monotonic()
+
+
+def _memory():
+    usage = {"maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss", "Private_Dirty"):
+                    usage[key.lower() + "_kb"] = int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+
+    return usage
+
+
+def on_starting(server):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+    from app import metrics
+
+    # The counts of the workers of a previous run would add to the new ones.
+    metrics.shared.clear()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    from highlighter_api.engine import engine
+
+    engine.load()
+
+    # Keep the garbage collector from touching (and so copying) the pages of
+    # the preloaded objects in every worker.
+    gc.freeze()
+
+    server.log.info(
+        "[Startup] mode: preload, master ready: %.3fs, engine: %.3fs, memory: %s",
+        time.monotonic() - _started,
+        engine.load_time,
+        _memory(),
+    )
+
+
+def post_worker_init(worker):
+    from highlighter_api.engine import engine
+    from highlighter_api.twitch import token_manager
+
+    engine.load()
+    token_manager.start()
+
+    worker.log.info(
+        "[Startup] mode: %s, pid: %s, worker ready: %.3fs, engine: %.3fs, memory: %s",
+        "preload" if preload_app else "worker",
+        worker.pid,
+        time.monotonic() - _started,
+        engine.load_time,
+        _memory(),
+    )
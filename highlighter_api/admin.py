@@ -4,3 +4,9 @@ from highlighter_api import models
 admin.site.register(models.Video)
 admin.site.register(models.HighlightRange)
 admin.site.register(models.UserVote)
+admin.site.register(models.RangeScore)
+admin.site.register(models.HighlightResult)
+admin.site.register(models.CrawlJob)
+admin.site.register(models.CrawlLock)
+admin.site.register(models.TwitchToken)
+admin.site.register(models.UnsupportedVideo)
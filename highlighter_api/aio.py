@@ -0,0 +1,276 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pandas as pd
+from app import metrics
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from highlighter.utils.load import VideoChatsData
+
+from . import metadata, pipeline
+from .chatstore import chat_store
+from .engine import engine
+from .chats import CHAT_COLUMNS, ChatBuilder, concat_chats
+from .crawl import add_comments
+from .locks import acrawl_flight, acrawl_lock
+from .models import Video
+from .results import result_cache
+from .scheduler import RETRY_STATUS, backoff_delay, crawl_scheduler, reset_after
+from .twitch import token_manager
+
+# Runs the predictor and the chat store, which are CPU and disk bound.
+executor = ThreadPoolExecutor(
+    settings.HIGHLIGHTER_PREDICT_WORKERS, thread_name_prefix="predict"
+)
+
+_client = None
+_semaphore = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the client shared by all requests, keeping connections open."""
+    global _client, _semaphore
+
+    if _client is None:
+        size = settings.HIGHLIGHTER_CRAWL_REQUESTS_MAX
+        _client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+        )
+        _semaphore = asyncio.Semaphore(size)
+
+    return _client
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    """GET `url`, retrying rate limited and failed requests like the crawler."""
+    client = get_client()
+
+    for attempt in range(settings.HIGHLIGHTER_CRAWL_RETRIES + 1):
+        last = attempt == settings.HIGHLIGHTER_CRAWL_RETRIES
+
+        try:
+            async with _semaphore:
+                res = await client.get(url, **kwargs)
+        except httpx.TransportError:
+            if last:
+                raise
+
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        crawl_scheduler.observe(res)
+
+        if res.status_code not in RETRY_STATUS or last:
+            res.raise_for_status()
+            return res
+
+        if res.status_code == 429:
+            await asyncio.sleep(reset_after(res))
+        else:
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+async def helix_get(path: str, params):
+    token = await sync_to_async(token_manager.get)()
+
+    for retry in (False, True):
+        try:
+            res = await get(
+                f"{settings.TWITCH_API_URL}/helix/{path}",
+                params=params,
+                headers={
+                    "Client-Id": token_manager.client_id,
+                    "Authorization": f"Bearer {token}",
+                },
+            )
+            return res.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return {"data": []}
+
+            if e.response.status_code != 401 or retry:
+                raise
+
+        token = await sync_to_async(token_manager.refresh)(stale=token)
+
+
+@metrics.timed("duration")
+async def get_duration(vid: int):
+    """`metadata.get_duration` asking Twitch without blocking."""
+    durations = await sync_to_async(metadata.get_known_durations)([vid])
+
+    if vid in durations:
+        return durations[vid]
+
+    data = (await helix_get("videos", {"id": vid}))["data"]
+
+    if not data:
+        await sync_to_async(metadata.reject)(vid, "not found")
+        return None
+
+    duration = metadata.parse_duration(data[0]["duration"])
+    durations = await sync_to_async(metadata.record_durations)({vid: duration})
+    return durations[vid]
+
+
+async def fetch_segment(vid: int, start: int, end: int) -> pd.DataFrame:
+    chats = ChatBuilder()
+    params = {"content_offset_seconds": start}
+
+    while True:
+        res = await get(
+            f"{settings.TWITCH_API_URL}/v5/videos/{vid}/comments",
+            params=params,
+            headers={
+                "Client-ID": token_manager.client_id,
+                "Accept": "application/vnd.twitchtv.v5+json",
+            },
+        )
+        cursor = add_comments(chats, res.json(), start, end)
+
+        if cursor is None:
+            return chats.to_frame(settings.HIGHLIGHTER_COMPACT_CHATS)
+
+        params = {"cursor": cursor}
+
+
+async def store_video_chats(vid: int, vlen: int):
+    """
+    `pipeline.store_video_chats` without blocking, fetching as many segments
+    at a time as requests may be in flight.
+    """
+    segment = settings.HIGHLIGHTER_CRAWL_SEGMENT
+    starts = range(0, vlen, segment)
+    group = settings.HIGHLIGHTER_CRAWL_REQUESTS_MAX
+
+    async with in_executor(chat_store.writer(vid, vlen)) as write:
+
+        def write_frame(df):
+            write(df.drop_duplicates("id").drop("id", axis=1))
+
+        for i in range(0, len(starts), group):
+            frames = await asyncio.gather(
+                *(
+                    fetch_segment(vid, start, min(start + segment, vlen))
+                    for start in starts[i : i + group]
+                )
+            )
+
+            for df in frames:
+                await run_in_executor(write_frame, df)
+
+
+def save_video_chats(vid: int, vlen: int, frames) -> pd.DataFrame:
+    """Join the crawled segments of `vid` and store them."""
+    if frames:
+        df = concat_chats(frames).drop_duplicates("id")
+    else:
+        df = pd.DataFrame(columns=CHAT_COLUMNS)
+
+    df = df.drop("id", axis=1)
+    chat_store.save(vid, vlen, df)
+    return df
+
+
+async def fetch_video_chats(vid: int):
+    vlen = await get_duration(vid)
+
+    if vlen is None:
+        return None
+
+    segment = settings.HIGHLIGHTER_CRAWL_SEGMENT
+
+    st = time.time()
+    if vlen > chat_store.window:
+        await store_video_chats(vid, vlen)
+        frames = None
+    else:
+        frames = await asyncio.gather(
+            *(
+                fetch_segment(vid, start, min(start + segment, vlen))
+                for start in range(0, vlen, segment)
+            )
+        )
+    et = time.time()
+
+    print(f"[Fetch] vid: {vid}, vlen: {vlen}, time: {et - st}")
+
+    if frames is None:
+        return chat_store.open(vid, vlen)
+
+    df = await run_in_executor(save_video_chats, vid, vlen, frames)
+    return VideoChatsData(vid, vlen, df)
+
+
+@metrics.timed("crawl")
+async def crawl_video_chats(vid: int, timeout: float):
+    async with acrawl_lock(vid, timeout):
+        # Another process may have finished the crawl while we waited.
+        vcd = await run_in_executor(chat_store.load, vid)
+
+        if vcd is not None:
+            return vcd
+
+        return await fetch_video_chats(vid)
+
+
+async def load_highlights(vid: int):
+    """
+    Return `(duration, ranges)` with the top `HIGHLIGHTER_MAX_LIMIT` ranges
+    of `vid`, or `None` if it is not supported. Concurrent callers share one
+    crawl and prediction.
+    """
+    timeout = settings.HIGHLIGHTER_ASYNC_WAIT_TIMEOUT
+
+    async def load():
+        vcd = await run_in_executor(pipeline.load_local_chats, vid)
+
+        if vcd is None:
+            vcd = await crawl_video_chats(vid, timeout)
+
+        if vcd is None:
+            return None
+
+        # Only the prediction runs in the executor; the ORM calls stay in
+        # the thread Django reserves for them.
+        await sync_to_async(Video.objects.get_or_create)(
+            id=vid, defaults={"duration": vcd.vlen}
+        )
+        with metrics.stage("predict"):
+            ranges = await run_in_executor(
+                engine.predictor.get_highlight_ranges, vcd, result_cache.max_limit
+            )
+        await sync_to_async(result_cache.put)(vid, ranges)
+        return vcd.vlen, [tuple(r) for r in ranges]
+
+    return await acrawl_flight.do(vid, load, timeout)
+
+
+def run_in_executor(fn, *args):
+    # Like `sync_to_async`, run `fn` in the context of the caller, so the
+    # stages it times count towards the request.
+    context = contextvars.copy_context()
+    return asyncio.get_event_loop().run_in_executor(
+        executor, functools.partial(context.run, fn, *args)
+    )
+
+
+@contextlib.asynccontextmanager
+async def in_executor(cm):
+    """Enter and exit the context manager `cm`, which blocks, in the executor."""
+    value = await run_in_executor(cm.__enter__)
+
+    try:
+        yield value
+    except BaseException:
+        if not await run_in_executor(cm.__exit__, *sys.exc_info()):
+            raise
+    else:
+        await run_in_executor(cm.__exit__, None, None, None)
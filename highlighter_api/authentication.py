@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserStatusCache:
+    """
+    Remembers for `ttl` seconds whether users are active, so that only the
+    first request of a user in that time reads the user row. A deactivated
+    user keeps access for at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._statuses = OrderedDict()
+
+    def is_active(self, user_id):
+        """Return whether `user_id` is active, or `None` if it does not exist."""
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._statuses.get(user_id)
+
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+        User = get_user_model()
+        active = (
+            User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list("is_active", flat=True)
+            .first()
+        )
+
+        with self._lock:
+            self._statuses[user_id] = (active, now + self.ttl)
+            self._statuses.move_to_end(user_id)
+
+            while len(self._statuses) > self.max_entries:
+                self._statuses.popitem(last=False)
+
+        return active
+
+    def clear(self):
+        with self._lock:
+            self._statuses.clear()
+
+
+class TokenUserAuthentication(JWTTokenUserAuthentication):
+    """
+    `JWTAuthentication` without loading the user: `request.user` is a
+    `TokenUser` built from the claims, which is enough for the highlighter
+    endpoints as they only need the user id. Whether the user is still active
+    is checked through `user_statuses`, unless
+    `HIGHLIGHTER_AUTH_STATUS_TTL` is 0.
+    """
+
+    @metrics.timed("auth")
+    def authenticate(self, request):
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+
+        if user_statuses.ttl <= 0:
+            return user
+
+        active = user_statuses.is_active(user.id)
+
+        if active is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
+
+
+user_statuses = UserStatusCache(
+    settings.HIGHLIGHTER_AUTH_STATUS_TTL, settings.HIGHLIGHTER_AUTH_STATUS_CACHE_SIZE
+)
@@ -0,0 +1,178 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+
+# Same columns as the frames returned by `TwitchCrawler.get_chats`.
+CHAT_COLUMNS = ["id", "offset", "user", "message"]
+
+# Columns of compact frames stored as categoricals.
+TEXT_COLUMNS = ["user", "message"]
+
+# Compact frames hold offsets as int32 milliseconds, up to about 596 hours.
+OFFSET_UNITS = 1000
+
+
+def compact_offsets(seconds) -> np.ndarray:
+    """Return offsets in seconds as the int32 milliseconds of compact frames."""
+    return np.rint(np.asarray(seconds, np.float64) * OFFSET_UNITS).astype(np.int32)
+
+
+def is_compact(offsets: pd.Series) -> bool:
+    return pd.api.types.is_integer_dtype(offsets.dtype)
+
+
+def offset_seconds(df: pd.DataFrame) -> pd.Series:
+    """Return the offsets of `df` in seconds, whether it is compact or not."""
+    offsets = df["offset"]
+    return offsets / OFFSET_UNITS if is_compact(offsets) else offsets
+
+
+def to_offset(df: pd.DataFrame, seconds: float):
+    """Return `seconds` in the unit of the offsets of `df`."""
+    return seconds * OFFSET_UNITS if is_compact(df["offset"]) else seconds
+
+
+class ChatBuilder:
+    """
+    Collects the chats of a segment column by column: the offsets in an
+    array, and the users and messages as codes of their distinct values, so
+    that only one string per distinct value outlives the parsed pages.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.offsets = array("d")
+
+        self._user_codes = array("i")
+        self._users = {}
+        self._message_codes = array("i")
+        self._messages = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, cid: str, offset: float, user: str, message: str):
+        self.ids.append(cid)
+        self.offsets.append(offset)
+        self._user_codes.append(self._users.setdefault(user, len(self._users)))
+        self._message_codes.append(
+            self._messages.setdefault(message, len(self._messages))
+        )
+
+    def to_frame(self, compact: bool) -> pd.DataFrame:
+        """
+        Return the chats in `CHAT_COLUMNS`, with int32 millisecond offsets
+        and categorical users and messages if `compact`.
+        """
+        offsets = np.asarray(self.offsets, np.float64)
+        columns = {
+            "id": self.ids,
+            "offset": compact_offsets(offsets) if compact else offsets,
+        }
+
+        for column, codes, values in (
+            ("user", self._user_codes, self._users),
+            ("message", self._message_codes, self._messages),
+        ):
+            values = pd.Categorical.from_codes(
+                np.asarray(codes, np.int32), categories=list(values)
+            )
+            columns[column] = values if compact else np.asarray(values, dtype=object)
+
+        df = pd.DataFrame(columns, columns=CHAT_COLUMNS)
+
+        if not df["offset"].is_monotonic_increasing:
+            df = df.sort_values("offset", kind="stable", ignore_index=True)
+
+        return df
+
+
+def compact_chats(df: pd.DataFrame) -> pd.DataFrame:
+    """Return the chats of `df` sorted, with the columns of `ChatBuilder`."""
+    df = df.astype({column: "category" for column in TEXT_COLUMNS if column in df})
+
+    if not is_compact(df["offset"]):
+        df["offset"] = compact_offsets(df["offset"])
+
+    if not df["offset"].is_monotonic_increasing:
+        df = df.sort_values("offset", kind="stable", ignore_index=True)
+
+    return df
+
+
+def expand_chats(df: pd.DataFrame, start: float = 0) -> pd.DataFrame:
+    """
+    Return a copy of `df` with the columns the predictor was written for:
+    offsets in float seconds from `start`, and object columns in place of
+    categoricals.
+    """
+    columns = {}
+
+    for column in df:
+        if column == "offset":
+            values = (offset_seconds(df) - start).to_numpy()
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            values = np.asarray(df[column], dtype=object)
+        else:
+            values = df[column].to_numpy()
+
+        columns[column] = values
+
+    return pd.DataFrame(columns, columns=df.columns)
+
+
+def concat_chats(frames) -> pd.DataFrame:
+    """
+    `pd.concat` of chat frames in offset order, keeping compact offsets and
+    categorical columns when the frames are compact.
+    """
+    frames = list(frames)
+    df = pd.concat(frames, ignore_index=True)
+
+    # Empty frames may have float offsets, which would upcast the others.
+    offsets = [f["offset"] for f in frames if "offset" in f and len(f)]
+
+    if offsets and all(is_compact(o) for o in offsets):
+        df["offset"] = df["offset"].astype(np.int32)
+
+    for column in TEXT_COLUMNS:
+        # The categories of empty frames may have another dtype.
+        parts = [f[column] for f in frames if column in f and len(f)]
+
+        if parts and all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            df[column] = union_categoricals(parts, ignore_order=True)
+
+    return df
+
+
+def table_to_chats(table: pa.Table, compact: bool) -> pd.DataFrame:
+    """
+    Convert a stored chat log, with offsets in seconds, to a frame. With
+    `compact`, the text columns are dictionary encoded by Arrow first, so
+    only distinct values become Python strings.
+    """
+    if not compact:
+        return table.to_pandas()
+
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type):
+            column = table.column(i).dictionary_encode()
+            table = table.set_column(i, field.name, column)
+
+    df = table.to_pandas()
+    df["offset"] = compact_offsets(df["offset"])
+    return df
+
+
+def chats_to_table(df: pd.DataFrame) -> pa.Table:
+    """Convert a chat frame to a table to store, with offsets in seconds."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    if is_compact(df["offset"]):
+        i = table.schema.get_field_index("offset")
+        table = table.set_column(i, "offset", pa.array(offset_seconds(df)))
+
+    return table
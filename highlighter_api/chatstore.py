@@ -0,0 +1,199 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from app import metrics
+from django.conf import settings
+from highlighter.utils.load import VideoChatsData
+from pyarrow import feather
+
+from .chats import chats_to_table, table_to_chats
+
+# Columns of the logs written frame by frame by `ChatLogStore.writer`.
+CHAT_SCHEMA = pa.schema(
+    [("offset", pa.float64()), ("user", pa.string()), ("message", pa.string())]
+)
+
+
+class StoredVideoChats:
+    """
+    The chat log of a long video in the store, read record batch by record
+    batch instead of being loaded whole like `VideoChatsData`.
+    """
+
+    def __init__(self, vid: int, vlen: int, path: Path, compact: bool):
+        self.vid = vid
+        self.vlen = vlen
+        self.path = path
+        self.compact = compact
+
+    def frames(self):
+        """Yield the chats as data frames in offset order."""
+        with pa.memory_map(str(self.path)) as source:
+            reader = pa.ipc.open_file(source)
+
+            for i in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(i)])
+                yield table_to_chats(table, self.compact)
+
+
+class ChatLogStore:
+    """
+    Keeps crawled chat logs as Feather files in a directory shared by all
+    workers, memory-mapped when loaded; compressed logs are decompressed
+    whole instead. Files are evicted by last access (mtime) beyond
+    `max_bytes`. Logs of videos longer than `window` seconds are returned as
+    `StoredVideoChats`. With `compact`, logs are loaded as compact frames
+    (see `ChatBuilder`).
+    """
+
+    def __init__(self, root, max_bytes, compression, window, compact):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.window = window
+        self.compact = compact
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+    def path(self, vid: int) -> Path:
+        return self.root / f"{vid}.feather"
+
+    def load(self, vid: int):
+        path = self.path(vid)
+
+        try:
+            source = pa.memory_map(str(path))
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True)
+
+        with source:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted meanwhile; the mapping stays readable.
+                pass
+
+            reader = pa.ipc.open_file(source)
+            vlen = int(reader.schema.metadata[b"vlen"])
+
+            if vlen > self.window:
+                return self.open(vid, vlen)
+
+            df = table_to_chats(reader.read_all(), self.compact)
+            return VideoChatsData(vid, vlen, df)
+
+    def open(self, vid: int, vlen: int) -> StoredVideoChats:
+        """Return the stored log of the long video `vid`, without reading it."""
+        return StoredVideoChats(vid, vlen, self.path(vid), self.compact)
+
+    def save(self, vid: int, vlen: int, df: pd.DataFrame):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        table = chats_to_table(df)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), b"vlen": str(vlen).encode()}
+        )
+
+        path = self.path(vid)
+        tmp = self._tmp_path(path)
+        feather.write_feather(table, str(tmp), compression=self.compression)
+        os.replace(tmp, path)
+
+        self._evict()
+
+    @contextmanager
+    def writer(self, vid: int, vlen: int):
+        """
+        Write the chat log of `vid` one frame of `CHAT_SCHEMA` columns at a
+        time, for videos too long to hold in memory. Yields the function
+        writing a frame; the log is only stored if the block succeeds.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        schema = CHAT_SCHEMA.with_metadata({b"vlen": str(vlen).encode()})
+        options = pa.ipc.IpcWriteOptions(
+            compression=None if self.compression == "uncompressed" else self.compression
+        )
+
+        path = self.path(vid)
+        tmp = self._tmp_path(path)
+
+        try:
+            with pa.ipc.new_file(str(tmp), schema, options=options) as writer:
+
+                def write(df: pd.DataFrame):
+                    # Dictionaries may not change between the batches of a
+                    # file, so categorical columns are written as strings.
+                    writer.write_table(chats_to_table(df).cast(schema))
+
+                yield write
+
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+        self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _tmp_path(self, path: Path) -> Path:
+        return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _evict(self):
+        files = []
+        for p in self.root.glob("*.feather"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+
+        files.sort()
+        total = sum(f[1] for f in files)
+
+        for _, size, p in files:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+chat_store = ChatLogStore(
+    settings.HIGHLIGHTER_CHAT_STORE_DIR,
+    settings.HIGHLIGHTER_CHAT_STORE_SIZE,
+    settings.HIGHLIGHTER_CHAT_STORE_COMPRESSION,
+    settings.HIGHLIGHTER_PREDICT_WINDOW,
+    settings.HIGHLIGHTER_COMPACT_CHATS,
+)
+
+metrics.Callback(
+    "highlighter_chat_store_requests_total",
+    "counter",
+    "Lookups of the stored chat logs, by result.",
+    lambda: metrics.hit_counts(chat_store.stats()),
+    ("result",),
+)
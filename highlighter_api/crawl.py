@@ -0,0 +1,124 @@
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from django.conf import settings
+
+from .chats import ChatBuilder
+from .models import CrawlJob
+from .scheduler import crawl_scheduler
+from .twitch import token_manager
+
+
+def add_comments(chats: ChatBuilder, data, start: int, end: int):
+    """
+    Append the comments of the page `data` with `start <= offset < end` to
+    `chats`, and return the cursor of the next page or `None` at the end.
+    """
+    for comment in data["comments"]:
+        offset = comment["content_offset_seconds"]
+
+        if offset >= end:
+            return None
+
+        if offset < start:
+            continue
+
+        chats.append(
+            comment["_id"],
+            offset,
+            comment["commenter"]["_id"],
+            comment["message"]["body"],
+        )
+
+    return data.get("_next") or None
+
+
+class SegmentCrawler:
+    """
+    Crawls the chats of a video in fixed `segment` second windows, so that
+    the chats of the start of the video can be used before the whole video
+    has been crawled.
+    """
+
+    def __init__(
+        self,
+        vid: int,
+        vlen: int,
+        segment: int,
+        priority=CrawlJob.Priority.INTERACTIVE,
+    ):
+        self.vid = vid
+        self.vlen = vlen
+        self.segment = segment
+        self.priority = priority
+
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Client-ID": token_manager.client_id,
+                "Accept": "application/vnd.twitchtv.v5+json",
+            }
+        )
+
+    def segments(self):
+        return [
+            (start, min(start + self.segment, self.vlen))
+            for start in range(0, self.vlen, self.segment)
+        ]
+
+    def get_comments(self, params):
+        res = crawl_scheduler.get(
+            self._session,
+            f"{settings.TWITCH_API_URL}/v5/videos/{self.vid}/comments",
+            self.priority,
+            params=params,
+            timeout=10,
+        )
+        return res.json()
+
+    def fetch_segment(self, start: int, end: int) -> pd.DataFrame:
+        """Return the chats with `start <= offset < end`."""
+        chats = ChatBuilder()
+        params = {"content_offset_seconds": start}
+
+        while True:
+            data = self.get_comments(params)
+            cursor = add_comments(chats, data, start, end)
+
+            if cursor is None:
+                return chats.to_frame(settings.HIGHLIGHTER_COMPACT_CHATS)
+
+            params = {"cursor": cursor}
+
+    def stream(self, worker=10):
+        """
+        Yield `(crawled, df)` for every segment in order, where `crawled` is
+        the offset up to which the video has been crawled. At most `2 *
+        worker` segments are fetched ahead of the one yielded, so long
+        videos are not held in memory whole.
+        """
+        segments = iter(self.segments())
+
+        with ThreadPoolExecutor(worker) as executor:
+            futures = deque()
+
+            def submit(n):
+                for start, end in itertools.islice(segments, n):
+                    futures.append(
+                        (end, executor.submit(self.fetch_segment, start, end))
+                    )
+
+            submit(2 * worker)
+
+            try:
+                while futures:
+                    end, future = futures.popleft()
+                    df = future.result()
+                    submit(1)
+                    yield end, df
+            finally:
+                for _, future in futures:
+                    future.cancel()
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from app import metrics
+from django.conf import settings
+from highlighter.predict import Predictor
+from highlighter.utils.load import DataSetLoader
+
+from .windows import WindowedPredictor
+
+
+class Engine:
+    """
+    Owns the dataset loader and the predictor. They are built on first use,
+    or ahead of forking by the gunicorn master when preloading is enabled so
+    that all workers share the loaded weights copy-on-write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dsloader = None
+        self._predictor = None
+
+        self.load_time = None
+
+    @property
+    def loaded(self):
+        return self._predictor is not None
+
+    @property
+    def dsloader(self) -> DataSetLoader:
+        self.load()
+        return self._dsloader
+
+    @property
+    def predictor(self) -> WindowedPredictor:
+        self.load()
+        return self._predictor
+
+    def load(self):
+        if self.loaded:
+            return
+
+        with self._lock:
+            if self.loaded:
+                return
+
+            st = time.perf_counter()
+            self._dsloader = DataSetLoader()
+            self._predictor = WindowedPredictor(
+                Predictor(),
+                settings.HIGHLIGHTER_PREDICT_WINDOW,
+                settings.HIGHLIGHTER_PREDICT_WINDOW_OVERLAP,
+                settings.HIGHLIGHTER_RANGE_MAX_OVERLAP,
+            )
+            self.load_time = time.perf_counter() - st
+
+            print(f"[Engine] pid: {os.getpid()}, load time: {self.load_time}")
+
+
+engine = Engine()
+
+metrics.Callback(
+    "highlighter_engine_load_seconds",
+    "gauge",
+    "Longest time the model took to load in a process.",
+    lambda: engine.load_time,
+    merge=max,
+)
@@ -0,0 +1,16 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {
+        "detail": "Service Unavailable",
+        "notice": "The service is currently unavailable. Please retry in a minute.",
+    }
+    default_code = "service_unavailable"
+
+    def __init__(self, wait=60, detail=None, code=None):
+        super().__init__(detail, code)
+        # Rendered as the Retry-After header by the DRF exception handler.
+        self.wait = wait
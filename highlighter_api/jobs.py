@@ -0,0 +1,133 @@
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import pipeline
+from .exceptions import ServiceUnavailable
+from .locks import Heartbeat
+from .models import CrawlJob
+
+
+def enqueue(vid: int, priority=CrawlJob.Priority.INTERACTIVE) -> CrawlJob:
+    """
+    Return the open job that will produce the highlights of `vid`, creating
+    a new one if the last job has ended.
+    """
+    return enqueue_many([vid], priority)[vid]
+
+
+def _open_jobs(vids):
+    jobs = {}
+    for job in (
+        CrawlJob.objects.filter(vid__in=vids)
+        .filter(status__in=[CrawlJob.Status.PENDING, CrawlJob.Status.RUNNING])
+        .order_by("id")
+    ):
+        jobs[job.vid] = job
+
+    return jobs
+
+
+def enqueue_many(vids, priority=CrawlJob.Priority.INTERACTIVE):
+    jobs = _open_jobs(vids)
+    missing = [vid for vid in dict.fromkeys(vids) if vid not in jobs]
+    raised = [job.id for job in jobs.values() if job.priority > priority]
+
+    if raised:
+        # Someone is waiting for a video that was only being prefetched.
+        CrawlJob.objects.filter(id__in=raised).update(priority=priority)
+        for job in jobs.values():
+            job.priority = min(job.priority, priority)
+
+    if missing:
+        CrawlJob.objects.bulk_create(
+            [CrawlJob(vid=vid, priority=priority) for vid in missing]
+        )
+        jobs.update(_open_jobs(missing))
+
+    return jobs
+
+
+def requeue_stale_jobs():
+    """
+    Put back jobs whose worker died while running them, which stopped
+    renewing their heartbeat. Those out of attempts fail instead.
+    """
+    now = timezone.now()
+    deadline = now - settings.HIGHLIGHTER_CRAWL_JOB_TIMEOUT
+    stale = CrawlJob.objects.filter(status=CrawlJob.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=deadline)
+        | Q(heartbeat_at__isnull=True, started_at__lt=deadline)
+    )
+
+    stale.filter(attempts__gte=settings.HIGHLIGHTER_CRAWL_MAX_ATTEMPTS).update(
+        status=CrawlJob.Status.FAILED,
+        error=out_of_attempts(),
+        finished_at=now,
+    )
+    return stale.update(status=CrawlJob.Status.PENDING)
+
+
+def out_of_attempts() -> str:
+    return f"Gave up after {settings.HIGHLIGHTER_CRAWL_MAX_ATTEMPTS} attempts"
+
+
+def _beat(job: CrawlJob):
+    CrawlJob.objects.filter(id=job.id, status=CrawlJob.Status.RUNNING).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def claim_next():
+    with transaction.atomic():
+        job = (
+            CrawlJob.objects.select_for_update(skip_locked=True)
+            .filter(status=CrawlJob.Status.PENDING)
+            .order_by("priority", "created_at")
+            .first()
+        )
+
+        if job is None:
+            return None
+
+        job.status = CrawlJob.Status.RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=["status", "started_at", "heartbeat_at", "attempts"])
+
+    return job
+
+
+def run(job: CrawlJob):
+    interval = settings.HIGHLIGHTER_CRAWL_JOB_TIMEOUT.total_seconds() / 3
+
+    try:
+        with Heartbeat(lambda: _beat(job), interval):
+            vcd = pipeline.load_video_chats(job.vid, job.priority)
+
+            if vcd is None:
+                job.status = CrawlJob.Status.UNSUPPORTED
+            else:
+                pipeline.predict_highlights(vcd, settings.HIGHLIGHTER_MAX_LIMIT)
+                job.status = CrawlJob.Status.DONE
+    except ServiceUnavailable:
+        if job.attempts < settings.HIGHLIGHTER_CRAWL_MAX_ATTEMPTS:
+            # The video is being crawled by someone else; try again later.
+            job.status = CrawlJob.Status.PENDING
+        else:
+            job.status = CrawlJob.Status.FAILED
+            job.error = out_of_attempts()
+            print(f"[Job] vid: {job.vid}, {job.error}")
+    except Exception:
+        job.status = CrawlJob.Status.FAILED
+        job.error = traceback.format_exc()
+        print(f"[Job] vid: {job.vid}, failed:\n{job.error}")
+
+    if not job.is_active:
+        job.finished_at = timezone.now()
+
+    job.save(update_fields=["status", "error", "finished_at"])
+    return job
@@ -0,0 +1,219 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .exceptions import ServiceUnavailable
+from .models import CrawlLock
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key in this process: the first
+    caller runs `fn` and every other caller receives its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout: float):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise ServiceUnavailable(wait=max(int(timeout), 1))
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.event.set()
+
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class Heartbeat:
+    """
+    Calls `beat` every `interval` seconds in a background thread while the
+    block runs, so that rows marking work in progress, such as a crawl of a
+    long video, only expire once the process holding them is gone.
+    """
+
+    def __init__(self, beat, interval: float):
+        self.beat = beat
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            connection.close()
+
+
+def _lock_interval() -> float:
+    return settings.HIGHLIGHTER_CRAWL_LOCK_TTL.total_seconds() / 3
+
+
+def _try_lock(vid: int, owner: str) -> bool:
+    now = timezone.now()
+    CrawlLock.objects.filter(vid=vid, expires_at__lt=now).delete()
+
+    try:
+        with transaction.atomic():
+            CrawlLock.objects.create(
+                vid=vid,
+                owner=owner,
+                expires_at=now + settings.HIGHLIGHTER_CRAWL_LOCK_TTL,
+            )
+    except IntegrityError:
+        return False
+
+    return True
+
+
+def _renew_lock(vid: int, owner: str):
+    CrawlLock.objects.filter(vid=vid, owner=owner).update(
+        expires_at=timezone.now() + settings.HIGHLIGHTER_CRAWL_LOCK_TTL
+    )
+
+
+def _unlock(vid: int, owner: str):
+    CrawlLock.objects.filter(vid=vid, owner=owner).delete()
+
+
+@contextmanager
+def crawl_lock(vid: int, timeout: float):
+    """
+    Holds the `CrawlLock` row of `vid` so that only one process crawls it.
+    The row is renewed while held, and rows left behind by a dead process
+    expire after `HIGHLIGHTER_CRAWL_LOCK_TTL`.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    deadline = time.monotonic() + timeout
+
+    while not _try_lock(vid, owner):
+        if time.monotonic() >= deadline:
+            raise ServiceUnavailable(wait=max(int(timeout), 1))
+
+        time.sleep(0.5)
+
+    try:
+        with Heartbeat(lambda: _renew_lock(vid, owner), _lock_interval()):
+            yield
+    finally:
+        _unlock(vid, owner)
+
+
+@asynccontextmanager
+async def acrawl_lock(vid: int, timeout: float):
+    """`crawl_lock` for coroutines, waiting without blocking the event loop."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{id(asyncio.current_task())}"
+    deadline = time.monotonic() + timeout
+
+    while not await sync_to_async(_try_lock)(vid, owner):
+        if time.monotonic() >= deadline:
+            raise ServiceUnavailable(wait=max(int(timeout), 1))
+
+        await asyncio.sleep(0.5)
+
+    async def renew():
+        while True:
+            await asyncio.sleep(_lock_interval())
+
+            try:
+                await sync_to_async(_renew_lock)(vid, owner)
+            except Exception:
+                traceback.print_exc()
+
+    heartbeat = asyncio.ensure_future(renew())
+
+    try:
+        yield
+    finally:
+        heartbeat.cancel()
+        await sync_to_async(_unlock)(vid, owner)
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines of one event loop. The call keeps running
+    when its callers time out, so that its result is not lost.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn, timeout: float):
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise ServiceUnavailable(wait=max(int(timeout), 1))
+
+    def in_flight(self):
+        return len(self._tasks)
+
+    def _done(self, key, task):
+        del self._tasks[key]
+
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[Crawl] key: {key}, failed: {task.exception()!r}")
+
+
+crawl_flight = SingleFlight()
+acrawl_flight = AsyncSingleFlight()
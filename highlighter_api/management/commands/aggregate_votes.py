@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from highlighter_api import ranking
+
+
+class Command(BaseCommand):
+    help = "Aggregate the votes of highlight ranges into the scores used for ranking"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Aggregate again every this many seconds instead of once",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            st = time.perf_counter()
+            created, updated, deleted = ranking.aggregate(
+                settings.HIGHLIGHTER_VOTE_PRIOR
+            )
+            et = time.perf_counter()
+
+            self.stdout.write(
+                f"Aggregated votes (created: {created}, updated: {updated}, "
+                f"deleted: {deleted}, time: {et - st:.2f}s)"
+            )
+
+            if options["interval"] is None:
+                break
+
+            time.sleep(options["interval"])
@@ -0,0 +1,142 @@
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from highlighter_api.chats import CHAT_COLUMNS, ChatBuilder
+from highlighter_api.chatstore import ChatLogStore
+from highlighter_api.crawl import add_comments
+
+EMOTES = ["LUL", "PogChamp", "KEKW", "monkaS", "Kappa", "OMEGALUL", "5Head", "EZ"]
+
+
+def comment_pages(hours: float, rate: float, users: int, seed=0):
+    """
+    Yield v5 comment pages of a `hours` long VOD with `rate` chats a second:
+    mostly repeated emotes and short reactions, and some unique messages.
+    """
+    rnd = random.Random(seed)
+    reactions = [" ".join(rnd.choices(EMOTES, k=rnd.randint(1, 3))) for _ in range(500)]
+    offset = 0.0
+    vlen = hours * 60 * 60
+    page = []
+
+    while offset < vlen:
+        offset += rnd.expovariate(rate)
+
+        if rnd.random() < 0.7:
+            message = rnd.choice(reactions)
+        else:
+            message = f"message {len(page)} at {offset:.3f} " + rnd.choice(EMOTES)
+
+        page.append(
+            {
+                "_id": f"{rnd.getrandbits(64):016x}",
+                "content_offset_seconds": round(offset, 3),
+                "commenter": {"_id": str(rnd.randrange(users))},
+                "message": {"body": message},
+            }
+        )
+
+        if len(page) == 60:
+            yield {"comments": page, "_next": "next"}
+            page = []
+
+    yield {"comments": page}
+
+
+def build_rows(pages):
+    """
+    How `add_comments` collected a segment before `ChatBuilder`, with the
+    object columns of the pandas version of highlighter-core.
+    """
+    rows = {column: [] for column in CHAT_COLUMNS}
+
+    for data in pages:
+        for comment in data["comments"]:
+            rows["id"].append(comment["_id"])
+            rows["offset"].append(comment["content_offset_seconds"])
+            rows["user"].append(comment["commenter"]["_id"])
+            rows["message"].append(comment["message"]["body"])
+
+    return pd.DataFrame(
+        {
+            column: pd.Series(values, dtype=None if column == "offset" else object)
+            for column, values in rows.items()
+        }
+    )
+
+
+def build_chats(pages, compact: bool):
+    chats = ChatBuilder()
+
+    for data in pages:
+        add_comments(chats, data, 0, float("inf"))
+
+    return chats.to_frame(compact)
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+class Command(BaseCommand):
+    help = "Compare the memory of compact chat frames with object columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=6,
+            help="Duration of the generated VOD",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=10,
+            help="Chats per second",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=5000,
+            help="Number of distinct chatters",
+        )
+
+    def handle(self, *args, **options):
+        pages = list(comment_pages(options["hours"], options["rate"], options["users"]))
+        formats = {
+            "objects": lambda: build_rows(pages),
+            "compact": lambda: build_chats(pages, compact=True),
+        }
+
+        self.stdout.write(
+            f"{sum(len(p['comments']) for p in pages)} chats, "
+            f"{options['hours']:g} hours"
+        )
+
+        with tempfile.TemporaryDirectory() as root:
+            for name, build in formats.items():
+                st = time.perf_counter()
+                df = build().drop("id", axis=1)
+                build_time = time.perf_counter() - st
+
+                compact = name == "compact"
+                store = ChatLogStore(
+                    Path(root) / name, 2 ** 40, "lz4", 2 ** 31, compact
+                )
+                store.save(1, int(options["hours"] * 60 * 60), df)
+
+                st = time.perf_counter()
+                loaded = store.load(1).df
+                load_time = time.perf_counter() - st
+
+                self.stdout.write(
+                    f"{name:<8} build: {build_time * 1e3:7.1f}ms, "
+                    f"{frame_bytes(df) / 1e6:7.1f}MB, "
+                    f"load: {load_time * 1e3:7.1f}ms, "
+                    f"{frame_bytes(loaded) / 1e6:7.1f}MB"
+                )
@@ -0,0 +1,54 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from highlighter_api import ids
+from highlighter_api.views import (
+    HIGHLIGHT_ID_TTL,
+    decode_highlight_id,
+    encode_legacy_ids,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare the cost and size of compact highlight ids and legacy JWTs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ranges",
+            type=int,
+            default=10,
+            help="Number of ranges per response",
+        )
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=2000,
+            help="Number of responses to time",
+        )
+
+    def handle(self, *args, **options):
+        user = User(id=123456, username="benchmark")
+        vid = 782734234
+        vranges = [(i * 100, i * 100 + 50, 0.5) for i in range(options["ranges"])]
+        number = options["number"]
+
+        formats = {
+            "jwt": lambda: encode_legacy_ids(user, vid, vranges),
+            "compact": lambda: ids.encode_ids(user.id, vid, vranges, HIGHLIGHT_ID_TTL),
+        }
+
+        for name, encode in formats.items():
+            hids = encode()
+            encode_time = timeit.timeit(encode, number=number) / number
+            decode_time = (
+                timeit.timeit(lambda: decode_highlight_id(user, hids[0]), number=number)
+                / number
+            )
+
+            self.stdout.write(
+                f"{name:<8} encode: {encode_time * 1e6:8.1f}us per response "
+                f"({len(vranges)} ranges), decode: {decode_time * 1e6:6.1f}us, "
+                f"size: {len(hids[0])} bytes"
+            )
@@ -0,0 +1,74 @@
+import gzip
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework import renderers
+
+from app.middleware import brotli
+from app.renderers import JSONRenderer
+from highlighter_api import ids
+
+
+def highlight(vid: int, ranges: int):
+    hids = ids.encode_ids(123456, vid, [(i, i + 50) for i in range(ranges)], 60)
+    return {
+        "id": vid,
+        "duration": 34093,
+        "partial": False,
+        "progress": 1.0,
+        "highlights": [
+            {
+                "id": hid,
+                "start": 1905 + i * 100,
+                "end": 1955 + i * 100,
+                "probability": 0.8838140368461609,
+                "upvoted": True,
+                "downvoted": False,
+                "upvotes": 12,
+                "downvotes": 1,
+            }
+            for i, hid in enumerate(hids)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the JSON renderer with the indented REST framework renderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=2000,
+            help="Number of renders to time",
+        )
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        payloads = {
+            "single": highlight(782734234, 3),
+            "batch": {
+                "results": [{"status": "ok", **highlight(vid, 10)} for vid in range(50)]
+            },
+        }
+        formats = {
+            # The renderer before the switch to orjson.
+            "indent=2": lambda data: renderers.JSONRenderer().render(
+                data, renderer_context={"indent": 2}
+            ),
+            "orjson": lambda data: JSONRenderer().render(data, renderer_context={}),
+        }
+
+        for payload, data in payloads.items():
+            for name, render in formats.items():
+                body = render(data)
+                seconds = timeit.timeit(lambda: render(data), number=number) / number
+
+                sizes = f"gzip: {len(gzip.compress(body, 6)):6d}"
+                if brotli is not None:
+                    sizes += f", br: {len(brotli.compress(body, quality=5)):6d}"
+
+                self.stdout.write(
+                    f"{payload:<6} {name:<8} {seconds * 1e6:8.1f}us, "
+                    f"bytes: {len(body):6d}, {sizes}"
+                )
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from highlighter_api import jobs
+from highlighter_api.engine import engine
+from highlighter_api.twitch import token_manager
+
+
+class Command(BaseCommand):
+    help = "Crawl and predict the videos queued by the highlighter API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.HIGHLIGHTER_CRAWL_CONCURRENCY,
+            help="Maximum number of jobs running at the same time",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        futures = set()
+
+        engine.load()
+        token_manager.start()
+        requeued = jobs.requeue_stale_jobs()
+        self.stdout.write(
+            f"Crawl worker started (concurrency: {concurrency}, requeued: {requeued})"
+        )
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                futures = {f for f in futures if not f.done()}
+
+                if len(futures) >= concurrency:
+                    time.sleep(0.1)
+                    continue
+
+                job = jobs.claim_next()
+
+                if job is None:
+                    if options["once"] and not futures:
+                        break
+
+                    time.sleep(options["poll_interval"])
+                    jobs.requeue_stale_jobs()
+                    continue
+
+                self.stdout.write(f"[Job] vid: {job.vid}, attempt: {job.attempts}")
+                futures.add(executor.submit(self.run_job, job))
+
+    def run_job(self, job):
+        try:
+            job = jobs.run(job)
+            self.stdout.write(f"[Job] vid: {job.vid}, status: {job.status}")
+        finally:
+            connection.close()
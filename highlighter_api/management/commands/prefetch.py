@@ -0,0 +1,87 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from highlighter_api import prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue the recent videos of tracked channels for the crawl worker, so "
+        "that their highlights are ready before the first viewer asks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--channel",
+            action="append",
+            default=[],
+            help="Login of a channel to prefetch (repeatable), in addition to "
+            "HIGHLIGHTER_PREFETCH_CHANNELS",
+        )
+        parser.add_argument(
+            "--voted",
+            action="store_true",
+            help="Also prefetch the channels of videos with votes",
+        )
+        parser.add_argument(
+            "--since",
+            type=float,
+            default=settings.HIGHLIGHTER_PREFETCH_SINCE.total_seconds() / 3600,
+            help="Only prefetch videos published in the last hours",
+        )
+        parser.add_argument(
+            "--per-channel",
+            type=int,
+            default=20,
+            help="Number of recent videos to look at per channel",
+        )
+        parser.add_argument(
+            "--max-pending",
+            type=int,
+            default=settings.HIGHLIGHTER_PREFETCH_MAX_PENDING,
+            help="Maximum number of open prefetch jobs",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be prefetched",
+        )
+
+    def handle(self, *args, **options):
+        logins = settings.HIGHLIGHTER_PREFETCH_CHANNELS + options["channel"]
+        channels = prefetch.get_channel_ids(logins) if logins else {}
+
+        if options["voted"]:
+            channels.update(prefetch.get_voted_channel_ids())
+
+        if not channels:
+            raise CommandError("No channels to prefetch")
+
+        since = timezone.now() - datetime.timedelta(hours=options["since"])
+        candidates = prefetch.plan(
+            channels, since, options["per_channel"], options["max_pending"]
+        )
+
+        for c in candidates:
+            self.stdout.write(
+                f"{c.channel:<25} {c.vid:>12} {c.duration:>6}s "
+                f"{c.created_at:%Y-%m-%d %H:%M} {c.action}"
+            )
+
+        queued = sum(c.action == prefetch.QUEUE for c in candidates)
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Would queue {queued} of {len(candidates)} videos "
+                f"from {len(channels)} channels"
+            )
+            return
+
+        prefetch.prefetch(candidates)
+        self.stdout.write(
+            f"Queued {queued} of {len(candidates)} videos "
+            f"from {len(channels)} channels"
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from highlighter_api.models import HighlightRange, UserVote
+
+
+def _vote_count(vote_type):
+    votes = (
+        UserVote.objects.filter(highlight_range=OuterRef("pk"), vote_type=vote_type)
+        .order_by()
+        .values("highlight_range")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    return Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored vote counters of highlight ranges from UserVote"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--video",
+            type=int,
+            action="append",
+            help="Only rebuild the ranges of this video (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        ranges = HighlightRange.objects.all()
+
+        if options["video"]:
+            ranges = ranges.filter(video_id__in=options["video"])
+
+        updated = ranges.update(
+            upvotes=_vote_count(UserVote.VoteType.UPVOTE),
+            downvotes=_vote_count(UserVote.VoteType.DOWNVOTE),
+        )
+
+        self.stdout.write(f"Rebuilt vote counts of {updated} highlight ranges")
@@ -0,0 +1,116 @@
+import re
+
+from app import metrics
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UnsupportedVideo, Video
+from .twitch import call_crawler, helix_get
+
+HELIX_BATCH_SIZE = 100
+
+DURATION_RE = re.compile(r"^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$")
+
+
+def parse_duration(duration: str) -> int:
+    """Parse a Helix duration such as `3h8m33s` into seconds."""
+    h, m, s = DURATION_RE.match(duration).groups()
+    return int(h or 0) * 3600 + int(m or 0) * 60 + int(s or 0)
+
+
+def get_unsupported(vids):
+    return set(
+        UnsupportedVideo.objects.filter(
+            vid__in=vids, expires_at__gt=timezone.now()
+        ).values_list("vid", flat=True)
+    )
+
+
+def is_unsupported(vid: int) -> bool:
+    return bool(get_unsupported([vid]))
+
+
+def reject(vid: int, reason: str, duration=None):
+    UnsupportedVideo.objects.update_or_create(
+        vid=vid,
+        defaults={
+            "duration": duration,
+            "reason": reason,
+            "expires_at": timezone.now() + settings.HIGHLIGHTER_UNSUPPORTED_TTL,
+        },
+    )
+
+
+def record_durations(durations):
+    """
+    Store `{vid: duration}` looked up from Twitch and return it with `None`
+    for the videos that are too long.
+    """
+    supported = {}
+
+    for vid, duration in durations.items():
+        if duration > settings.HIGHLIGHTER_MAX_DURATION:
+            reject(vid, "too long", duration)
+            supported[vid] = None
+        else:
+            supported[vid] = duration
+
+    Video.objects.bulk_create(
+        [Video(id=vid, duration=d) for vid, d in supported.items() if d is not None],
+        ignore_conflicts=True,
+    )
+    return supported
+
+
+def get_duration(vid: int):
+    """Return the duration of `vid`, or `None` if it is not supported."""
+    return resolve_durations([vid])[vid]
+
+
+def get_known_durations(vids):
+    """
+    Return `{vid: duration or None}` of the videos of `vids` that are in the
+    `Video` table or rejected, without asking Twitch.
+    """
+    durations = dict(Video.objects.filter(id__in=vids).values_list("id", "duration"))
+
+    rest = [vid for vid in vids if vid not in durations]
+    for vid in get_unsupported(rest):
+        durations[vid] = None
+
+    return durations
+
+
+@metrics.timed("duration")
+def resolve_durations(vids, batch=False):
+    """
+    Return `{vid: duration or None}`, looking at the `Video` table and the
+    rejected videos before asking Twitch. With `batch`, unknown videos are
+    resolved with one Helix call per 100 videos instead of one call each.
+    """
+    durations = get_known_durations(vids)
+
+    rest = [vid for vid in vids if vid not in durations]
+    if not rest:
+        return durations
+
+    if not batch:
+        for vid in rest:
+            vlen = call_crawler(lambda crawler: crawler.get_video_duration(vid))
+            durations.update(record_durations({vid: vlen}))
+
+        return durations
+
+    for i in range(0, len(rest), HELIX_BATCH_SIZE):
+        chunk = rest[i : i + HELIX_BATCH_SIZE]
+        data = helix_get("videos", [("id", vid) for vid in chunk])["data"]
+
+        found = {int(v["id"]): parse_duration(v["duration"]) for v in data}
+        durations.update(record_durations(found))
+
+        for vid in chunk:
+            if vid not in found:
+                reject(vid, "not found")
+                durations[vid] = None
+
+    return durations
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HighlightResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_version', models.CharField(max_length=64)),
+                ('limit', models.IntegerField()),
+                ('ranges', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('accessed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='highlight_results', to='highlighter_api.video')),
+            ],
+            options={
+                'unique_together': {('video', 'model_version')},
+            },
+        ),
+    ]
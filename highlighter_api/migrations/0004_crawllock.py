@@ -0,0 +1,21 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0003_crawljob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlLock',
+            fields=[
+                ('vid', models.IntegerField(primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=128)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0004_crawllock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uservote',
+            index=models.Index(fields=['user', 'highlight_range', 'vote_type'], name='highlighter_user_id_0678a5_idx'),
+        ),
+    ]
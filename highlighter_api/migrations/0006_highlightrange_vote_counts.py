@@ -0,0 +1,43 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:29
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    HighlightRange = apps.get_model('highlighter_api', 'HighlightRange')
+    UserVote = apps.get_model('highlighter_api', 'UserVote')
+
+    def vote_count(vote_type):
+        votes = (
+            UserVote.objects.filter(highlight_range=OuterRef('pk'), vote_type=vote_type)
+            .order_by()
+            .values('highlight_range')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+        return Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+
+    HighlightRange.objects.update(upvotes=vote_count('UP'), downvotes=vote_count('DOWN'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0005_uservote_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlightrange',
+            name='downvotes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='highlightrange',
+            name='upvotes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0006_highlightrange_vote_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TwitchToken',
+            fields=[
+                ('client_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('access_token', models.TextField(blank=True, default='')),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
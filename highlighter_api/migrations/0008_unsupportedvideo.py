@@ -0,0 +1,22 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0007_twitchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnsupportedVideo',
+            fields=[
+                ('vid', models.IntegerField(primary_key=True, serialize=False)),
+                ('duration', models.IntegerField(blank=True, null=True)),
+                ('reason', models.TextField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0008_unsupportedvideo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlightresult',
+            name='progress',
+            field=models.FloatField(default=1.0),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0009_highlightresult_progress'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='crawljob',
+            name='highlighter_status_9b046f_idx',
+        ),
+        migrations.AddField(
+            model_name='crawljob',
+            name='priority',
+            field=models.IntegerField(choices=[(0, 'Interactive'), (1, 'Prefetch')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='crawljob',
+            index=models.Index(fields=['status', 'priority', 'created_at'], name='highlighter_status_901a43_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.5 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0010_crawljob_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RangeScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('upvotes', models.IntegerField()),
+                ('downvotes', models.IntegerField()),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='range_scores', to='highlighter_api.video')),
+            ],
+            options={
+                'unique_together': {('video', 'start', 'end')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('highlighter_api', '0011_rangescore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
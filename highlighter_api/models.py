@@ -12,6 +12,29 @@ class Video(models.Model):
         return f"Video object ({self.id})"
 
 
+class HighlightResult(models.Model):
+    video = models.ForeignKey(
+        Video, on_delete=models.CASCADE, related_name="highlight_results"
+    )
+    model_version = models.CharField(max_length=64)
+    limit = models.IntegerField()
+    ranges = models.JSONField()
+    # Fraction of the video the ranges were predicted from, below 1 while
+    # the chats are still being crawled.
+    progress = models.FloatField(default=1.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    accessed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"HighlightResult ({self.video}, {self.model_version}, {self.limit})"
+
+    def __repr__(self) -> str:
+        return f"HighlightResult object ({self.id}, {self.model_version})"
+
+    class Meta:
+        unique_together = ("video", "model_version")
+
+
 class VideoRange(models.Model):
     start = models.IntegerField()
     end = models.IntegerField()
@@ -25,39 +48,35 @@ class HighlightRange(VideoRange):
         Video, on_delete=models.CASCADE, related_name="highlight_ranges"
     )
 
+    upvotes = models.IntegerField(default=0)
+    downvotes = models.IntegerField(default=0)
+
     @property
     def upvote_count(self):
-        return self.highlight_range_votes.filter(vote_type="UP").count()
+        return self.upvotes
+
+    @property
+    def downvote_count(self):
+        return self.downvotes
 
     def upvote(self, user):
-        self.highlight_range_votes: models.BaseManager
+        from .votes import cast_vote
 
-        self.highlight_range_votes.update_or_create(
-            user=user,
-            highlight_range=self,
-            defaults={"vote_type": UserVote.VoteType.UPVOTE},
+        return cast_vote(
+            user.pk, self.video_id, self.start, self.end, UserVote.VoteType.UPVOTE
         )
-        return "Upvoted this highlight video"
 
     def downvote(self, user):
-        self.highlight_range_votes.update_or_create(
-            user=user,
-            highlight_range=self,
-            defaults={"vote_type": UserVote.VoteType.DOWNVOTE},
+        from .votes import cast_vote
+
+        return cast_vote(
+            user.pk, self.video_id, self.start, self.end, UserVote.VoteType.DOWNVOTE
         )
-        return "Downvoted this highlight video"
 
     def remove_vote(self, user):
-        uv = self.highlight_range_votes.filter(user=user, highlight_range=self).first()
-        if uv is not None:
-            vt = uv.vote_type
-            uv.delete()
-            if vt == UserVote.VoteType.UPVOTE:
-                return "Removed from upvoted videos"
-            else:
-                return "Removed from downvoted videos"
-        else:
-            return "Removed from voted videos"
+        from .votes import remove_vote
+
+        return remove_vote(user.pk, self.video_id, self.start, self.end)
 
     def __str__(self) -> str:
         return f"HighlightRange ({self.video}, {self.start}, {self.end})"
@@ -69,6 +88,32 @@ class HighlightRange(VideoRange):
         unique_together = ("video", "start", "end")
 
 
+class RangeScore(VideoRange):
+    """
+    Community score of a voted highlight range, aggregated from the vote
+    counters by `manage.py aggregate_votes` so that serving reads one row
+    per range instead of the votes.
+    """
+
+    video = models.ForeignKey(
+        Video, on_delete=models.CASCADE, related_name="range_scores"
+    )
+
+    upvotes = models.IntegerField()
+    downvotes = models.IntegerField()
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"RangeScore ({self.video}, {self.start}, {self.end}, {self.score})"
+
+    def __repr__(self) -> str:
+        return f"RangeScore object ({self.id}, {self.start}, {self.end})"
+
+    class Meta:
+        unique_together = ("video", "start", "end")
+
+
 class UserVote(models.Model):
     class VoteType(models.TextChoices):
         UPVOTE = "UP", "Upvote"
@@ -94,3 +139,83 @@ class UserVote(models.Model):
 
     class Meta:
         unique_together = ("user", "highlight_range")
+        # Lets vote lookups by user be answered from the index alone.
+        indexes = [models.Index(fields=["user", "highlight_range", "vote_type"])]
+
+
+class CrawlJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        RUNNING = "RUNNING", "Running"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+        UNSUPPORTED = "UNSUPPORTED", "Unsupported"
+
+    class Priority(models.IntegerChoices):
+        INTERACTIVE = 0, "Interactive"
+        PREFETCH = 1, "Prefetch"
+
+    vid = models.IntegerField(db_index=True)
+    status = models.TextField(choices=Status.choices, default=Status.PENDING)
+    priority = models.IntegerField(
+        choices=Priority.choices, default=Priority.INTERACTIVE
+    )
+    error = models.TextField(blank=True, default="")
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker while the job runs, so that only jobs of dead
+    # workers are put back, however long the crawl takes.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_active(self):
+        return self.status in (self.Status.PENDING, self.Status.RUNNING)
+
+    def __str__(self) -> str:
+        return f"CrawlJob ({self.vid}, {self.status})"
+
+    def __repr__(self) -> str:
+        return f"CrawlJob object ({self.id}, {self.vid}, {self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "priority", "created_at"])]
+
+
+class CrawlLock(models.Model):
+    vid = models.IntegerField(primary_key=True)
+    owner = models.CharField(max_length=128)
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"CrawlLock ({self.vid}, {self.owner})"
+
+    def __repr__(self) -> str:
+        return f"CrawlLock object ({self.vid}, {self.owner}, {self.expires_at})"
+
+
+class TwitchToken(models.Model):
+    client_id = models.CharField(max_length=64, primary_key=True)
+    access_token = models.TextField(blank=True, default="")
+    expires_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"TwitchToken ({self.client_id}, {self.expires_at})"
+
+    def __repr__(self) -> str:
+        return f"TwitchToken object ({self.client_id}, {self.expires_at})"
+
+
+class UnsupportedVideo(models.Model):
+    vid = models.IntegerField(primary_key=True)
+    duration = models.IntegerField(null=True, blank=True)
+    reason = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"UnsupportedVideo ({self.vid}, {self.reason})"
+
+    def __repr__(self) -> str:
+        return f"UnsupportedVideo object ({self.vid}, {self.reason}, {self.expires_at})"
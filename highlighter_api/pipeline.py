@@ -0,0 +1,161 @@
+import time
+
+import pandas as pd
+from app import metrics
+from django.conf import settings
+from highlighter.utils.load import VideoChatsData
+
+from . import metadata
+from .chatstore import chat_store
+from .chats import CHAT_COLUMNS, compact_chats, concat_chats
+from .crawl import SegmentCrawler
+from .engine import engine
+from .locks import crawl_flight, crawl_lock
+from .models import CrawlJob, Video
+from .results import result_cache
+from .scheduler import crawl_scheduler
+
+
+@metrics.timed("load")
+def load_local_chats(vid: int):
+    vcd = engine.dsloader.load_chats_by_vid(vid)
+
+    if vcd is not None:
+        return vcd
+
+    return chat_store.load(vid)
+
+
+def predict_partial_highlights(vid: int, vlen: int, crawled: int, frames):
+    """
+    Predict the highlights of the first `crawled` seconds of `vid` and store
+    them as a partial result until the crawl finishes.
+    """
+    df = concat_chats(frames).drop("id", axis=1)
+    vcd = VideoChatsData(vid, crawled, df)
+
+    Video.objects.get_or_create(id=vid, defaults={"duration": vlen})
+    ranges = engine.predictor.get_highlight_ranges(vcd, result_cache.max_limit)
+    result_cache.put(vid, ranges, progress=crawled / vlen)
+
+    print(f"[Partial] vid: {vid}, crawled: {crawled}/{vlen}")
+
+
+def stream_video_chats(vid: int, vlen: int, priority: int, partial: bool):
+    """
+    Crawl the chats of `vid` segment by segment within the budget of the
+    scheduler, predicting partial highlights along the way if `partial`.
+    """
+    crawler = SegmentCrawler(vid, vlen, settings.HIGHLIGHTER_CRAWL_SEGMENT, priority)
+    frames = []
+    last = time.monotonic()
+
+    # The scheduler limits the requests actually in flight.
+    for crawled, df in crawler.stream(worker=crawl_scheduler.max_size):
+        frames.append(df)
+
+        if crawled >= vlen:
+            # The final result is predicted from the saved chats.
+            break
+
+        if partial and (
+            time.monotonic() - last >= settings.HIGHLIGHTER_PARTIAL_INTERVAL
+        ):
+            predict_partial_highlights(vid, vlen, crawled, frames)
+            last = time.monotonic()
+
+    if not frames:
+        return pd.DataFrame(columns=CHAT_COLUMNS)
+
+    # Pages of adjacent segments may overlap.
+    return concat_chats(frames).drop_duplicates("id")
+
+
+def store_video_chats(vid: int, vlen: int, priority: int):
+    """
+    Crawl a video too long to hold in memory straight into the chat store,
+    one segment at a time.
+    """
+    crawler = SegmentCrawler(vid, vlen, settings.HIGHLIGHTER_CRAWL_SEGMENT, priority)
+
+    with chat_store.writer(vid, vlen) as write:
+        for _, df in crawler.stream(worker=crawl_scheduler.max_size):
+            write(df.drop_duplicates("id").drop("id", axis=1))
+
+
+def fetch_video_chats(vid: int, priority=CrawlJob.Priority.INTERACTIVE):
+    vlen = metadata.get_duration(vid)
+
+    if vlen is None:
+        return None
+
+    st = time.time()
+    with crawl_scheduler.crawl():
+        if vlen > chat_store.window:
+            # Predicted window by window from the store, without partial
+            # results.
+            store_video_chats(vid, vlen, priority)
+            df = None
+        else:
+            # Not crawled by the core crawler, whose requests would bypass
+            # the scheduler and its rate limit handling.
+            df = stream_video_chats(
+                vid, vlen, priority, partial=settings.HIGHLIGHTER_CRAWL_STREAMING
+            )
+    et = time.time()
+
+    print(f"[Fetch] vid: {vid}, vlen: {vlen}, time: {et - st}")
+
+    if df is None:
+        return chat_store.open(vid, vlen)
+
+    df = df.drop("id", axis=1)
+
+    if settings.HIGHLIGHTER_COMPACT_CHATS:
+        df = compact_chats(df)
+    chat_store.save(vid, vlen, df)
+    return VideoChatsData(vid, vlen, df)
+
+
+@metrics.timed("crawl")
+def crawl_video_chats(vid: int, priority=CrawlJob.Priority.INTERACTIVE):
+    """
+    Crawl `vid` at most once at a time across threads and processes. Raises
+    `ServiceUnavailable` if the running crawl does not finish in time.
+    """
+    timeout = settings.HIGHLIGHTER_CRAWL_WAIT_TIMEOUT
+
+    def crawl():
+        with crawl_lock(vid, timeout):
+            # Another process may have finished the crawl while we waited.
+            vcd = chat_store.load(vid)
+
+            if vcd is not None:
+                return vcd
+
+            return fetch_video_chats(vid, priority)
+
+    return crawl_flight.do(vid, crawl, timeout)
+
+
+def load_video_chats(vid: int, priority=CrawlJob.Priority.INTERACTIVE):
+    vcd = load_local_chats(vid)
+
+    if vcd is not None:
+        return vcd
+
+    return crawl_video_chats(vid, priority)
+
+
+@metrics.timed("predict")
+def predict_highlights(vcd, limit: int):
+    Video.objects.get_or_create(id=vcd.vid, defaults={"duration": vcd.vlen})
+    return result_cache.compute(vcd, limit, engine.predictor)
+
+
+@metrics.timed("predict")
+def predict_many_highlights(vcds, limit: int):
+    Video.objects.bulk_create(
+        [Video(id=vcd.vid, duration=vcd.vlen) for vcd in vcds], ignore_conflicts=True
+    )
+    return result_cache.compute_many(vcds, limit, engine.predictor)
@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import jobs, metadata
+from .models import CrawlJob, HighlightRange, HighlightResult
+from .twitch import helix_get
+
+Candidate = namedtuple(
+    "Candidate", ["channel", "vid", "duration", "created_at", "action"]
+)
+
+# Actions of the candidates; only QUEUE is enqueued.
+QUEUE = "queue"
+CACHED = "cached"
+PENDING = "pending"
+LIVE = "live"
+TOO_LONG = "too long"
+UNSUPPORTED = "unsupported"
+OVER_LIMIT = "over limit"
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), metadata.HELIX_BATCH_SIZE):
+        yield items[i : i + metadata.HELIX_BATCH_SIZE]
+
+
+def get_channel_ids(logins):
+    """Return `{user_id: login}` of the channels named `logins`."""
+    channels = {}
+
+    for chunk in _chunks(logins):
+        data = helix_get("users", [("login", login) for login in chunk])["data"]
+        channels.update({u["id"]: u["login"] for u in data})
+
+    return channels
+
+
+def get_voted_channel_ids():
+    """Return `{user_id: login}` of the channels of the videos with votes."""
+    vids = (
+        HighlightRange.objects.filter(Q(upvotes__gt=0) | Q(downvotes__gt=0))
+        .values_list("video_id", flat=True)
+        .distinct()
+    )
+    channels = {}
+
+    for chunk in _chunks(vids):
+        data = helix_get("videos", [("id", vid) for vid in chunk])["data"]
+        channels.update({v["user_id"]: v["user_login"] for v in data})
+
+    return channels
+
+
+def get_live_since(user_ids):
+    """Return `{user_id: started_at}` of the channels that are live."""
+    live = {}
+
+    for chunk in _chunks(user_ids):
+        data = helix_get("streams", [("user_id", uid) for uid in chunk])["data"]
+        live.update({s["user_id"]: parse_datetime(s["started_at"]) for s in data})
+
+    return live
+
+
+def get_recent_videos(user_id: str, since, first: int):
+    data = helix_get("videos", {"user_id": user_id, "type": "archive", "first": first})[
+        "data"
+    ]
+
+    videos = []
+    for v in data:
+        created_at = parse_datetime(v["created_at"])
+
+        if created_at >= since:
+            videos.append(
+                (int(v["id"]), metadata.parse_duration(v["duration"]), created_at)
+            )
+
+    return videos
+
+
+def plan(channels, since, per_channel: int, max_pending: int):
+    """
+    Return the `Candidate` videos of `channels` published after `since`,
+    with the action prefetching would take for each of them. At most
+    `max_pending` prefetch jobs are left open.
+    """
+    live = get_live_since(channels)
+    found = []
+
+    for user_id, login in channels.items():
+        for vid, duration, created_at in get_recent_videos(user_id, since, per_channel):
+            # The archive of a running stream is still growing.
+            if user_id in live and created_at >= live[user_id]:
+                found.append(Candidate(login, vid, duration, created_at, LIVE))
+            else:
+                found.append(Candidate(login, vid, duration, created_at, None))
+
+    vids = [c.vid for c in found]
+    cached = set(
+        HighlightResult.objects.filter(
+            video_id__in=vids,
+            model_version=settings.HIGHLIGHTER_RESULT_VERSION,
+            progress__gte=1,
+        ).values_list("video_id", flat=True)
+    )
+    open_jobs = set(
+        CrawlJob.objects.filter(
+            vid__in=vids,
+            status__in=[CrawlJob.Status.PENDING, CrawlJob.Status.RUNNING],
+        ).values_list("vid", flat=True)
+    )
+    unsupported = metadata.get_unsupported(vids)
+    slots = max_pending - (
+        CrawlJob.objects.filter(
+            priority=CrawlJob.Priority.PREFETCH,
+            status__in=[CrawlJob.Status.PENDING, CrawlJob.Status.RUNNING],
+        ).count()
+    )
+
+    # Newest videos first, as they are the most likely to be watched.
+    found.sort(key=lambda c: c.created_at, reverse=True)
+
+    candidates = []
+    for c in found:
+        if c.action is not None:
+            action = c.action
+        elif c.vid in cached:
+            action = CACHED
+        elif c.vid in open_jobs:
+            action = PENDING
+        elif c.vid in unsupported:
+            action = UNSUPPORTED
+        elif c.duration > settings.HIGHLIGHTER_MAX_DURATION:
+            action = TOO_LONG
+        elif slots <= 0:
+            action = OVER_LIMIT
+        else:
+            action = QUEUE
+            slots -= 1
+
+        candidates.append(c._replace(action=action))
+
+    return candidates
+
+
+def prefetch(candidates):
+    """Enqueue the candidates to queue as prefetch jobs."""
+    metadata.record_durations(
+        {c.vid: c.duration for c in candidates if c.action in (QUEUE, TOO_LONG)}
+    )
+
+    queued = [c.vid for c in candidates if c.action == QUEUE]
+    if not queued:
+        return {}
+
+    return jobs.enqueue_many(queued, priority=CrawlJob.Priority.PREFETCH)
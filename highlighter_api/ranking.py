@@ -0,0 +1,101 @@
+from app import metrics
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import HighlightRange, RangeScore
+
+# Ids per delete, below the 999 variables of a query on older SQLite builds.
+DELETE_BATCH_SIZE = 900
+
+
+def community_score(upvotes: int, downvotes: int, prior: float) -> float:
+    """
+    Return the net approval of a range in (-1, 1), shrunk towards 0 as if it
+    had `prior` more votes split evenly, so a few votes move it little.
+    """
+    return (upvotes - downvotes) / (upvotes + downvotes + prior)
+
+
+def aggregate(prior: float):
+    """
+    Bring `RangeScore` in line with the vote counters of the highlight
+    ranges, writing only the scores that changed. Returns the number of
+    `(created, updated, deleted)` scores.
+    """
+    counts = {
+        (vid, start, end): (up, down)
+        for vid, start, end, up, down in HighlightRange.objects.filter(
+            Q(upvotes__gt=0) | Q(downvotes__gt=0)
+        ).values_list("video_id", "start", "end", "upvotes", "downvotes")
+    }
+    scores = {
+        (s.video_id, s.start, s.end): s
+        for s in RangeScore.objects.only(
+            "id", "video_id", "start", "end", "upvotes", "downvotes", "score"
+        )
+    }
+
+    now = timezone.now()
+    created = []
+    updated = []
+
+    for key, (up, down) in counts.items():
+        score = scores.get(key)
+        value = community_score(up, down, prior)
+
+        if score is None:
+            created.append(
+                RangeScore(
+                    video_id=key[0],
+                    start=key[1],
+                    end=key[2],
+                    upvotes=up,
+                    downvotes=down,
+                    score=value,
+                )
+            )
+        elif (score.upvotes, score.downvotes, score.score) != (up, down, value):
+            score.upvotes = up
+            score.downvotes = down
+            score.score = value
+            score.updated_at = now
+            updated.append(score)
+
+    deleted = [s.id for key, s in scores.items() if key not in counts]
+
+    with transaction.atomic():
+        RangeScore.objects.bulk_create(created, batch_size=1000)
+        RangeScore.objects.bulk_update(
+            updated, ["upvotes", "downvotes", "score", "updated_at"], batch_size=1000
+        )
+
+        for i in range(0, len(deleted), DELETE_BATCH_SIZE):
+            batch = deleted[i : i + DELETE_BATCH_SIZE]
+            RangeScore.objects.filter(id__in=batch).delete()
+
+    return len(created), len(updated), len(deleted)
+
+
+@metrics.timed("scores")
+def get_scores(vids):
+    """Return `{vid: {(start, end): score}}` of the scored ranges of `vids`."""
+    scores = {}
+
+    for vid, start, end, score in RangeScore.objects.filter(
+        video_id__in=vids
+    ).values_list("video_id", "start", "end", "score"):
+        scores.setdefault(vid, {})[(start, end)] = score
+
+    return scores
+
+
+def rerank(ranges, scores, weight: float):
+    """
+    Order `ranges` by their probability plus `weight` times their community
+    score in `scores`. Ranges nobody voted on keep their probability, and
+    the probabilities returned are the model's.
+    """
+    return sorted(
+        ranges, key=lambda r: r[2] + weight * scores.get((r[0], r[1]), 0), reverse=True
+    )
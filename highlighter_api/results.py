@@ -0,0 +1,278 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app import metrics
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import ranking
+from .models import HighlightResult
+
+TOUCH_INTERVAL = datetime.timedelta(minutes=1)
+
+
+class CachedResult(namedtuple("CachedResult", ["duration", "ranges", "progress"])):
+    @property
+    def partial(self):
+        return self.progress < 1
+
+
+class HighlightResultCache:
+    """
+    Stores the top `HIGHLIGHTER_MAX_LIMIT` ranges of each video per result
+    version, which covers the model and the selection of its ranges, so that
+    any smaller limit is served by slicing the stored result.
+    With a `vote_weight`, the ranges are re-ranked by their aggregated
+    community scores before slicing.
+    """
+
+    def __init__(self, model_version, max_limit, max_entries, vote_weight):
+        self.model_version = model_version
+        self.max_limit = max_limit
+        self.max_entries = max_entries
+        self.vote_weight = vote_weight
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._purged = False
+
+    def get(self, vid: int, limit: int):
+        """Return a `CachedResult` or `None` on a miss."""
+        return self.get_many([vid], limit).get(vid)
+
+    @metrics.timed("cache")
+    def get_many(self, vids, limit: int):
+        """
+        Return `{vid: CachedResult}` for the cached videos of `vids`. Partial
+        results of videos still being crawled are included.
+        """
+        rows = HighlightResult.objects.filter(
+            video_id__in=vids, model_version=self.model_version
+        ).values_list(
+            "id",
+            "video_id",
+            "limit",
+            "ranges",
+            "progress",
+            "accessed_at",
+            "video__duration",
+        )
+
+        now = timezone.now()
+        found = {}
+        touch = []
+
+        for rid, vid, rlimit, ranges, progress, accessed_at, duration in rows:
+            if rlimit < limit:
+                continue
+
+            found[vid] = CachedResult(duration, [tuple(r) for r in ranges], progress)
+
+            if now - accessed_at > TOUCH_INTERVAL:
+                touch.append(rid)
+
+        if touch:
+            HighlightResult.objects.filter(id__in=touch).update(accessed_at=now)
+
+        ranked = self.rerank({vid: r.ranges for vid, r in found.items()}, limit)
+        found = {vid: r._replace(ranges=ranked[vid]) for vid, r in found.items()}
+
+        self._count(hits=len(found), misses=len(set(vids)) - len(found))
+        return found
+
+    def put(self, vid: int, ranges, progress=1.0):
+        """
+        Store the ranges of `vid`. A `progress` below 1 marks the ranges as
+        predicted from the chats crawled so far; they are replaced by the
+        final result.
+        """
+        self._purge_stale_versions()
+
+        ranges = [list(r) for r in ranges]
+        try:
+            with transaction.atomic():
+                HighlightResult.objects.update_or_create(
+                    video_id=vid,
+                    model_version=self.model_version,
+                    defaults={
+                        "limit": self.max_limit,
+                        "ranges": ranges,
+                        "progress": progress,
+                        "accessed_at": timezone.now(),
+                    },
+                )
+        except IntegrityError:
+            # Another worker stored the same result concurrently.
+            pass
+
+        self._evict()
+
+    def put_many(self, results):
+        """
+        Store the final ranges of each vid of `results`, replacing partial
+        ones as `put` does.
+        """
+        self._purge_stale_versions()
+
+        now = timezone.now()
+        rows = [
+            HighlightResult(
+                video_id=vid,
+                model_version=self.model_version,
+                limit=self.max_limit,
+                ranges=[list(r) for r in ranges],
+                progress=1.0,
+                accessed_at=now,
+            )
+            for vid, ranges in results.items()
+        ]
+
+        with transaction.atomic():
+            ids = dict(
+                HighlightResult.objects.filter(
+                    video_id__in=results, model_version=self.model_version
+                ).values_list("video_id", "id")
+            )
+
+            for row in rows:
+                row.id = ids.get(row.video_id)
+
+            HighlightResult.objects.bulk_update(
+                [row for row in rows if row.id is not None],
+                ["limit", "ranges", "progress", "accessed_at"],
+            )
+            # Rows stored concurrently since are kept, as in `put`.
+            HighlightResult.objects.bulk_create(
+                [row for row in rows if row.id is None], ignore_conflicts=True
+            )
+
+        self._evict()
+
+    def compute(self, vcd, limit: int, predictor):
+        ranges = predictor.get_highlight_ranges(vcd, self.max_limit)
+        self.put(vcd.vid, ranges)
+        return self.rerank({vcd.vid: ranges}, limit)[vcd.vid]
+
+    def compute_many(self, vcds, limit: int, predictor):
+        results = {
+            vcd.vid: predictor.get_highlight_ranges(vcd, self.max_limit) for vcd in vcds
+        }
+        self.put_many(results)
+        return self.rerank(results, limit)
+
+    def rerank(self, ranges_by_vid, limit: int):
+        """
+        Return `{vid: ranges}` with the top `limit` ranges of each video,
+        re-ranked with one query for the scores of all of them.
+        """
+        if self.vote_weight and ranges_by_vid:
+            scores = ranking.get_scores(list(ranges_by_vid))
+        else:
+            scores = {}
+
+        ranked = {}
+
+        for vid, ranges in ranges_by_vid.items():
+            if vid in scores:
+                ranges = ranking.rerank(ranges, scores[vid], self.vote_weight)
+
+            ranked[vid] = [tuple(r) for r in ranges[:limit]]
+
+        return ranked
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _count(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _purge_stale_versions(self):
+        if self._purged:
+            return
+
+        HighlightResult.objects.exclude(model_version=self.model_version).delete()
+        self._purged = True
+
+    def _evict(self):
+        stale = HighlightResult.objects.order_by("-accessed_at").values_list(
+            "id", flat=True
+        )[self.max_entries :]
+        stale = list(stale)
+
+        if stale:
+            HighlightResult.objects.filter(id__in=stale).delete()
+
+
+def make_etag(data) -> str:
+    """Return a strong ETag of the JSON serializable `data`."""
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return '"%s"' % hashlib.sha1(body.encode()).hexdigest()[:20]
+
+
+class RangeETags:
+    """
+    Remembers the ETags of the final shared range responses in this process,
+    so that conditional requests for them are answered without any work.
+    Final results only change with the model version, which needs a restart,
+    but their order changes with the aggregated votes, so ETags are
+    forgotten after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._etags = OrderedDict()
+
+    def get(self, vid: int, limit: int):
+        with self._lock:
+            entry = self._etags.get((vid, limit))
+
+            if entry is None:
+                return None
+
+            if entry[1] <= time.monotonic():
+                del self._etags[(vid, limit)]
+                return None
+
+            self._etags.move_to_end((vid, limit))
+            return entry[0]
+
+    def put(self, vid: int, limit: int, etag: str):
+        with self._lock:
+            self._etags[(vid, limit)] = (etag, time.monotonic() + self.ttl)
+            self._etags.move_to_end((vid, limit))
+
+            while len(self._etags) > self.max_entries:
+                self._etags.popitem(last=False)
+
+
+result_cache = HighlightResultCache(
+    settings.HIGHLIGHTER_RESULT_VERSION,
+    settings.HIGHLIGHTER_MAX_LIMIT,
+    settings.HIGHLIGHTER_RESULT_CACHE_SIZE,
+    settings.HIGHLIGHTER_VOTE_WEIGHT,
+)
+
+metrics.Callback(
+    "highlighter_result_cache_requests_total",
+    "counter",
+    "Lookups of the cached results, by result.",
+    lambda: metrics.hit_counts(result_cache.stats()),
+    ("result",),
+)
+
+range_etags = RangeETags(
+    settings.HIGHLIGHTER_ETAG_CACHE_SIZE, settings.HIGHLIGHTER_RANGES_MAX_AGE
+)
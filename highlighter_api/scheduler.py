@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from app import metrics
+from django.conf import settings
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def reset_after(res) -> float:
+    """Return the seconds to wait after the rate limited response `res`."""
+    retry_after = res.headers.get("Retry-After")
+    if retry_after:
+        return min(float(retry_after), 60)
+
+    reset = res.headers.get("Ratelimit-Reset")
+    if reset:
+        return min(max(float(reset) - time.time(), 1), 60)
+
+    return 1
+
+
+def backoff_delay(attempt: int) -> float:
+    return min(2 ** attempt, 30) * random.uniform(0.5, 1)
+
+
+class CrawlScheduler:
+    """
+    Shares a budget of in-flight Twitch requests between all the crawls of
+    this process. The budget grows while Twitch reports spare rate limit and
+    shrinks when it runs low or rejects requests; the rate limit bucket is
+    shared by every process using the same client id, so the processes back
+    off together. Waiting requests are served by priority, lowest first.
+    """
+
+    def __init__(self, min_size: int, max_size: int, retries: int):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.retries = retries
+
+        self.size = float(max(min_size, max_size // 2))
+        self.in_flight = 0
+        self.crawls = 0
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    @contextmanager
+    def crawl(self):
+        """Count a running crawl."""
+        with self._cond:
+            self.crawls += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.crawls -= 1
+
+    @contextmanager
+    def slot(self, priority: int):
+        self._acquire(priority)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def get(self, session: requests.Session, url: str, priority: int, **kwargs):
+        """
+        GET `url` within the budget, retrying rate limited and failed
+        requests with exponential backoff.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.slot(priority):
+                    res = session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+
+                self._backoff(attempt)
+                continue
+
+            self.observe(res)
+
+            if res.status_code not in RETRY_STATUS or attempt == self.retries:
+                res.raise_for_status()
+                return res
+
+            self._backoff(attempt)
+
+    def observe(self, res):
+        """Adapt the budget to the rate limit headers of `res`."""
+        limit = res.headers.get("Ratelimit-Limit")
+        remaining = res.headers.get("Ratelimit-Remaining")
+
+        with self._cond:
+            if res.status_code == 429:
+                self.size = max(self.min_size, self.size / 2)
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + reset_after(res)
+                )
+            elif limit and remaining and int(remaining) < int(limit) / 10:
+                self.size = max(self.min_size, self.size - 1)
+            elif res.status_code < 400:
+                self.size = min(self.max_size, self.size + 1 / self.size)
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": int(self.size),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "crawls": self.crawls,
+            }
+
+    def _acquire(self, priority: int):
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+
+            while True:
+                wait = self._paused_until - time.monotonic()
+
+                if (
+                    wait <= 0
+                    and self._waiters[0] == entry
+                    and self.in_flight < int(self.size)
+                ):
+                    break
+
+                self._cond.wait(wait if wait > 0 else None)
+
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int):
+        time.sleep(backoff_delay(attempt))
+
+
+crawl_scheduler = CrawlScheduler(
+    settings.HIGHLIGHTER_CRAWL_REQUESTS_MIN,
+    settings.HIGHLIGHTER_CRAWL_REQUESTS_MAX,
+    settings.HIGHLIGHTER_CRAWL_RETRIES,
+)
+
+
+def _stat(key: str):
+    return lambda: crawl_scheduler.stats()[key]
+
+
+metrics.Callback(
+    "highlighter_crawls_running", "gauge", "Crawls running.", _stat("crawls")
+)
+metrics.Callback(
+    "highlighter_crawl_requests_in_flight",
+    "gauge",
+    "Twitch requests of the crawls in flight.",
+    _stat("in_flight"),
+)
+metrics.Callback(
+    "highlighter_crawl_requests_waiting",
+    "gauge",
+    "Twitch requests of the crawls waiting for the budget.",
+    _stat("waiting"),
+)
+metrics.Callback(
+    "highlighter_crawl_requests_budget",
+    "gauge",
+    "Twitch requests the crawls may have in flight.",
+    _stat("size"),
+)
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the `k` highest `scores`, highest first, in
+    O(n + k log k). Of equal scores, the first are ranked first.
+    """
+    if k >= len(scores):
+        return np.lexsort((np.arange(len(scores)), -scores))
+
+    kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[: k - len(above)]
+
+    idx = np.concatenate([above, ties])
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def overlaps(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Return the matrix of how much each pair of ranges overlaps, as a share
+    of the shorter one.
+    """
+    inter = np.minimum(ends[:, None], ends) - np.maximum(starts[:, None], starts)
+    shorter = np.minimum((ends - starts)[:, None], ends - starts)
+    return np.clip(inter, 0, None) / np.maximum(shorter, 1)
+
+
+def suppress(starts: np.ndarray, ends: np.ndarray, max_overlap: float) -> np.ndarray:
+    """
+    Return the indices of the ranges, in order of preference, that overlap
+    no preferred range by more than `max_overlap`.
+    """
+    suppressed = overlaps(starts, ends) > max_overlap
+    keep = np.ones(len(starts), dtype=bool)
+
+    for i in range(len(starts)):
+        if keep[i]:
+            keep[i + 1 :] &= ~suppressed[i, i + 1 :]
+
+    return np.flatnonzero(keep)
+
+
+def select_ranges(ranges, limit: int, max_overlap: float):
+    """
+    Return the `limit` most probable of the `(start, end, probability)`
+    `ranges`, most probable first, leaving out ranges that overlap a more
+    probable one by more than `max_overlap`. Only the top candidates are
+    ever sorted, so selecting from many ranges stays linear.
+    """
+    if not ranges or limit <= 0:
+        return []
+
+    values = np.array([r[:3] for r in ranges], dtype=np.float64)
+    starts, ends, scores = values.T
+    pool = limit
+
+    while True:
+        idx = top_k(scores, pool)
+        keep = idx[suppress(starts[idx], ends[idx], max_overlap)]
+
+        # Suppressed candidates leave room for the next most probable ones.
+        if len(keep) >= limit or pool >= len(ranges):
+            return [tuple(ranges[i]) for i in keep[:limit]]
+
+        pool *= 2
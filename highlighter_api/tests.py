@@ -1,3 +1,865 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import pandas as pd
+import pyarrow as pa
+import requests
+from app import metrics
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from highlighter.utils.load import VideoChatsData
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import aio, jobs, pipeline, ranking
+from .authentication import user_statuses
+from .chats import ChatBuilder
+from .chatstore import ChatLogStore
+from .exceptions import ServiceUnavailable
+from .locks import _try_lock, crawl_lock
+from .models import (
+    CrawlJob,
+    HighlightRange,
+    HighlightResult,
+    RangeScore,
+    UserVote,
+    Video,
+)
+from .results import HighlightResultCache, result_cache
+from .scheduler import CrawlScheduler
+from .views import buffer_vote
+from .votes import NO_VOTES, VoteBuffer, cast_vote, get_vote_states, remove_vote
+from .windows import WindowedPredictor
+
+RANGES = [(i * 100, i * 100 + 30, 1 - i / 20) for i in range(10)]
+
+
+def cache_video(vid: int, ranges=RANGES):
+    Video.objects.create(id=vid, duration=3600)
+    result_cache.put(vid, ranges)
+
+
+class HighlightLimitTests(TestCase):
+    def setUp(self):
+        cache_video(1)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+
+    def get_count(self, limit):
+        res = self.client.get("/highlighter/v1/twitch/1", {"limit": limit})
+        self.assertEqual(res.status_code, 200)
+        return len(res.json()["highlights"])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.get_count(-2), 1)
+        self.assertEqual(self.get_count(0), 1)
+        self.assertEqual(self.get_count(4), 4)
+        self.assertEqual(self.get_count(20), 10)
+
+    def test_invalid_limit(self):
+        res = self.client.get("/highlighter/v1/twitch/1", {"limit": "x"})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client.get("/highlighter/v1/twitch/async/1", {"limit": "x"})
+        self.assertEqual(res.status_code, 400)
+
+
+@override_settings(HIGHLIGHTER_CRAWL_MAX_ATTEMPTS=2)
+class JobAttemptsTests(TestCase):
+    def run_unavailable(self):
+        job = jobs.claim_next()
+
+        with mock.patch.object(
+            pipeline, "load_video_chats", side_effect=ServiceUnavailable()
+        ):
+            return jobs.run(job)
+
+    def test_unavailable_job_gives_up(self):
+        CrawlJob.objects.create(vid=1)
+
+        self.assertEqual(self.run_unavailable().status, CrawlJob.Status.PENDING)
+
+        job = self.run_unavailable()
+        self.assertEqual(job.status, CrawlJob.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(jobs.claim_next())
+
+    def test_stale_job_gives_up(self):
+        job = CrawlJob.objects.create(
+            vid=1,
+            status=CrawlJob.Status.RUNNING,
+            attempts=2,
+            started_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.FAILED)
+
+
+class AggregateTests(TestCase):
+    def test_deletes_are_batched(self):
+        Video.objects.create(id=1, duration=3600)
+        RangeScore.objects.bulk_create(
+            [
+                RangeScore(
+                    video_id=1, start=i, end=i + 30, upvotes=1, downvotes=0, score=0
+                )
+                for i in range(2000)
+            ]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ranking.aggregate(prior=5), (0, 0, 2000))
+
+        deletes = [q for q in queries if q["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(RangeScore.objects.exists())
+
+
+class HighlightRangesViewTests(TestCase):
+    def setUp(self):
+        cache_video(1)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+
+    def test_cached_per_credential(self):
+        res = self.client.get("/highlighter/v1/twitch/1/ranges")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("s-maxage", res["Cache-Control"])
+        self.assertTrue({"Authorization", "Cookie"} <= set(res["Vary"].split(", ")))
+
+        res = self.client.get(
+            "/highlighter/v1/twitch/1/ranges", HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        self.assertEqual(res.status_code, 304)
+        self.assertTrue({"Authorization", "Cookie"} <= set(res["Vary"].split(", ")))
+
+
+class CrawlJobViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+
+    def test_active_job_is_not_waited_on(self):
+        job = CrawlJob.objects.create(vid=1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(f"/highlighter/v1/twitch/jobs/{job.id}?wait=20")
+
+        self.assertEqual(res.json()["status"], CrawlJob.Status.PENDING)
+        self.assertEqual(res["Retry-After"], "2")
+
+    def test_finished_job(self):
+        job = CrawlJob.objects.create(vid=1, status=CrawlJob.Status.DONE)
+        res = self.client.get(f"/highlighter/v1/twitch/jobs/{job.id}")
+
+        self.assertEqual(res.json()["status"], CrawlJob.Status.DONE)
+        self.assertFalse(res.has_header("Retry-After"))
+
+
+class VoteStateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        cache_video(1)
+        cache_video(2)
+
+        for start, end, _ in RANGES:
+            cast_vote(self.user.id, 1, start, end, UserVote.VoteType.UPVOTE)
+
+    def test_queries_do_not_grow_with_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        counts = []
+
+        for limit in (1, 3, 10):
+            with CaptureQueriesContext(connection) as queries:
+                res = client.get("/highlighter/v1/twitch/1", {"limit": limit})
+
+            self.assertEqual(len(res.json()["highlights"]), limit)
+            self.assertTrue(all(h["upvoted"] for h in res.json()["highlights"]))
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[0], counts[2])
+
+    def test_exact_pairs(self):
+        # Pairs of the starts and ends asked for, but not asked for themselves.
+        other = UserVote.VoteType.DOWNVOTE
+        cast_vote(self.user.id, 1, 0, 130, other)
+        cast_vote(self.user.id, 1, 100, 30, other)
+        cast_vote(self.user.id, 2, 0, 30, other)
+
+        with self.assertNumQueries(1):
+            states = get_vote_states(self.user.id, {1: [(0, 30), (100, 130)]})
+
+        self.assertEqual(set(states), {(1, 0, 30), (1, 100, 130)})
+        self.assertEqual(states[(1, 0, 30)].vote_type, UserVote.VoteType.UPVOTE)
+        self.assertEqual(states[(1, 0, 30)].upvotes, 1)
+
+    def test_ranges_without_votes(self):
+        HighlightRange.objects.create(video_id=2, start=0, end=30)
+        states = get_vote_states(self.user.id, {2: [(0, 30), (100, 130)]})
+
+        self.assertEqual(states[(2, 0, 30)], (None, 0, 0))
+        self.assertEqual(states.get((2, 100, 130), NO_VOTES), NO_VOTES)
+        self.assertEqual(get_vote_states(self.user.id, {}), {})
+
+
+class VoteTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f"user{i}").id for i in range(3)]
+        Video.objects.create(id=1, duration=3600)
+
+    def assertCounts(self, upvotes, downvotes):
+        r = HighlightRange.objects.get(video_id=1, start=0, end=30)
+        self.assertEqual((r.upvotes, r.downvotes), (upvotes, downvotes))
+
+    def check_votes(self):
+        up, down = UserVote.VoteType.UPVOTE, UserVote.VoteType.DOWNVOTE
+
+        cast_vote(self.users[0], 1, 0, 30, up)
+        cast_vote(self.users[1], 1, 0, 30, up)
+        cast_vote(self.users[2], 1, 0, 30, down)
+        self.assertCounts(2, 1)
+
+        cast_vote(self.users[1], 1, 0, 30, down)
+        cast_vote(self.users[1], 1, 0, 30, down)
+        self.assertCounts(1, 2)
+
+        self.assertEqual(
+            remove_vote(self.users[0], 1, 0, 30), "Removed from upvoted videos"
+        )
+        self.assertEqual(
+            remove_vote(self.users[0], 1, 0, 30), "Removed from voted videos"
+        )
+        self.assertEqual(
+            remove_vote(self.users[0], 1, 50, 80), "Removed from voted videos"
+        )
+        self.assertCounts(0, 2)
+        self.assertEqual(UserVote.objects.count(), 2)
+
+    def test_votes(self):
+        self.check_votes()
+
+    def test_votes_without_returning(self):
+        # SQLite before 3.35, as bundled with Python 3.8 on Windows.
+        with mock.patch(
+            "highlighter_api.votes._can_return", return_value=False
+        ), CaptureQueriesContext(connection) as queries:
+            self.check_votes()
+
+        self.assertFalse(any("RETURNING" in q["sql"] for q in queries))
+
+
+class BufferedVoteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        Video.objects.create(id=1, duration=3600)
+
+        self.buffer = VoteBuffer(interval=60)
+        # Flushed by the tests instead of the background thread.
+        self.buffer._thread = mock.Mock()
+        patcher = mock.patch("highlighter_api.views.vote_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_remove_stored_vote(self):
+        key = (self.user.id, 1, 0, 30)
+        cast_vote(*key, UserVote.VoteType.UPVOTE)
+
+        self.assertEqual(buffer_vote(key, "removevote"), "Removed from upvoted videos")
+        self.buffer.flush()
+        self.assertFalse(UserVote.objects.exists())
+        self.assertEqual(buffer_vote(key, "removevote"), "Removed from voted videos")
+
+    def test_remove_buffered_vote(self):
+        key = (self.user.id, 1, 0, 30)
+        cast_vote(*key, UserVote.VoteType.DOWNVOTE)
+        buffer_vote(key, "upvote")
+
+        self.assertEqual(buffer_vote(key, "removevote"), "Removed from upvoted videos")
+        self.assertEqual(buffer_vote(key, "removevote"), "Removed from voted videos")
+
+    def test_failed_flush_is_retried(self):
+        key = (self.user.id, 1, 0, 30)
+        other = (self.user.id, 1, 100, 130)
+        buffer_vote(key, "upvote")
+        buffer_vote(other, "upvote")
+
+        with mock.patch(
+            "highlighter_api.votes._upsert_vote",
+            side_effect=OperationalError("database is down"),
+        ):
+            self.buffer.flush()
+
+        self.assertFalse(UserVote.objects.exists())
+
+        # A vote cast since the failure replaces the one that failed.
+        buffer_vote(other, "downvote")
+        self.buffer.flush()
+
+        votes = dict(
+            UserVote.objects.values_list("highlight_range__start", "vote_type")
+        )
+        self.assertEqual(
+            votes, {0: UserVote.VoteType.UPVOTE, 100: UserVote.VoteType.DOWNVOTE}
+        )
+        self.assertEqual(self.buffer.pending(*key), (False, None))
+
+
+class VoteIdTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("user"))
+
+    def test_id_must_be_a_string(self):
+        for body in ({"id": 1}, {"id": None}, {"id": ["a.b"]}, {}):
+            res = self.client.post(
+                "/highlighter/v1/twitch/vote/upvote", body, format="json"
+            )
+            self.assertEqual(res.status_code, 400, body)
+
+
+class FakeTwitchHandler(BaseHTTPRequestHandler):
+    """
+    Serves v5 comment pages of 5 chats from the requested offset, answering
+    with the statuses queued in `server.statuses` first.
+    """
+
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            server.requests.append((time.monotonic(), self.path))
+            status = server.statuses.pop(0) if server.statuses else 200
+
+        if status == 429:
+            self.send_response(429)
+            self.send_header("Ratelimit-Limit", "800")
+            self.send_header("Ratelimit-Remaining", "0")
+            self.send_header("Ratelimit-Reset", str(int(time.time()) + 1))
+            self.end_headers()
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        start = int(query.get("content_offset_seconds", ["0"])[0])
+        body = json.dumps(
+            {
+                "comments": [
+                    {
+                        "_id": f"{start}-{i}",
+                        "content_offset_seconds": start + i,
+                        "commenter": {"_id": str(i)},
+                        "message": {"body": "PogChamp"},
+                    }
+                    for i in range(5)
+                ]
+            }
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Ratelimit-Limit", "800")
+        self.send_header("Ratelimit-Remaining", "700")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CrawlSchedulerTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTwitchHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.statuses = []
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # Only the pause asked for by the rate limit delays the retries.
+        patcher = mock.patch("highlighter_api.scheduler.backoff_delay", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, scheduler, priority, path="/v5/videos/1/comments"):
+        return scheduler.get(requests.Session(), self.url + path, priority, timeout=5)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_rate_limited_request_is_retried(self):
+        scheduler = CrawlScheduler(1, 8, retries=3)
+        self.assertEqual(scheduler.size, 4)
+        self.server.statuses = [429]
+
+        res = self.get(scheduler, CrawlJob.Priority.INTERACTIVE)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()["comments"]), 5)
+        (first, _), (retry, _) = self.server.requests
+        # Requests are paused until the reset.
+        self.assertGreaterEqual(retry - first, 0.9)
+        # Halved to 2 by the 429, then grown by the success.
+        self.assertGreaterEqual(scheduler.size, 2)
+        self.assertLess(scheduler.size, 3)
+
+    def test_paused_requests_wait(self):
+        scheduler = CrawlScheduler(1, 8, retries=0)
+        self.server.statuses = [429]
+
+        with self.assertRaises(requests.HTTPError):
+            self.get(scheduler, CrawlJob.Priority.INTERACTIVE)
+
+        st = time.monotonic()
+        self.get(scheduler, CrawlJob.Priority.PREFETCH)
+        self.assertGreaterEqual(time.monotonic() - st, 0.5)
+
+    def test_prefetch_waits_behind_interactive(self):
+        scheduler = CrawlScheduler(1, 1, retries=0)
+        threads = [
+            threading.Thread(
+                target=self.get, args=(scheduler, priority, f"/{priority.label}")
+            )
+            for priority in (CrawlJob.Priority.PREFETCH, CrawlJob.Priority.INTERACTIVE)
+        ]
+
+        with scheduler.slot(CrawlJob.Priority.INTERACTIVE):
+            for i, thread in enumerate(threads, 1):
+                thread.start()
+                self.wait_for(lambda: scheduler.stats()["waiting"] == i)
+
+        for thread in threads:
+            thread.join()
+
+        paths = [path for _, path in self.server.requests]
+        self.assertEqual(paths, ["/Interactive", "/Prefetch"])
+
+    @override_settings(HIGHLIGHTER_CRAWL_STREAMING=False)
+    def test_default_crawl_is_scheduled(self):
+        scheduler = CrawlScheduler(1, 8, retries=3)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        store = ChatLogStore(root.name, 2 ** 30, "lz4", 2 ** 31, True)
+        Video.objects.create(id=1, duration=1500)
+        self.server.statuses = [429]
+
+        with override_settings(TWITCH_API_URL=self.url), mock.patch(
+            "highlighter_api.crawl.crawl_scheduler", scheduler
+        ), mock.patch(
+            "highlighter_api.pipeline.crawl_scheduler", scheduler
+        ), mock.patch(
+            "highlighter_api.pipeline.chat_store", store
+        ):
+            vcd = pipeline.fetch_video_chats(1)
+
+        # 3 segments of 10 minutes, one of them retried.
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(vcd.df), 15)
+        self.assertLess(scheduler.size, 4)
+        self.assertIsNotNone(store.load(1))
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        user_statuses.clear()
+        self.addCleanup(user_statuses.clear)
+
+        self.user = User.objects.create_user("user")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        cache_video(1)
+
+    def user_queries(self, path="/highlighter/v1/twitch/1"):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(path)
+
+        self.assertEqual(res.status_code, 200)
+        return [q["sql"] for q in queries if "auth_user" in q["sql"]]
+
+    def test_user_is_not_loaded(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+        self.assertEqual(self.user_queries("/highlighter/v1/twitch/1/votes"), [])
+
+    def test_vote_without_user_query(self):
+        self.user_queries()
+        hid = self.client.get("/highlighter/v1/twitch/1").json()["highlights"][0]["id"]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                "/highlighter/v1/twitch/vote/upvote", {"id": hid}, format="json"
+            )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(any("auth_user" in q["sql"] for q in queries))
+        self.assertTrue(UserVote.objects.filter(user=self.user).exists())
+
+    def test_inactive_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get("/highlighter/v1/twitch/1")
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json()["detail"], "User is inactive")
+
+    def test_status_check_can_be_skipped(self):
+        with mock.patch.object(user_statuses, "ttl", 0):
+            self.assertEqual(self.user_queries(), [])
+
+
+@override_settings(
+    HIGHLIGHTER_CRAWL_LOCK_TTL=datetime.timedelta(seconds=0.45),
+    HIGHLIGHTER_CRAWL_JOB_TIMEOUT=datetime.timedelta(seconds=0.45),
+)
+class HeartbeatTests(TransactionTestCase):
+    def test_lock_outlives_its_ttl(self):
+        with crawl_lock(1, timeout=1):
+            time.sleep(1.2)
+            self.assertFalse(_try_lock(1, "other"))
+
+        self.assertTrue(_try_lock(1, "other"))
+
+    def test_running_job_is_not_requeued(self):
+        CrawlJob.objects.create(vid=1)
+        job = jobs.claim_next()
+
+        def load_video_chats(vid, priority):
+            time.sleep(1.2)
+            return None
+
+        with mock.patch.object(pipeline, "load_video_chats", load_video_chats):
+            thread = threading.Thread(target=jobs.run, args=(job,))
+            thread.start()
+            time.sleep(0.9)
+            self.assertEqual(jobs.requeue_stale_jobs(), 0)
+            thread.join()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.UNSUPPORTED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_job_of_dead_worker_is_requeued(self):
+        CrawlJob.objects.create(
+            vid=1,
+            status=CrawlJob.Status.RUNNING,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+
+
+class RecordingPredictor:
+    """Ranks 100 second bins by their chats, recording the frames it is given."""
+
+    def __init__(self):
+        self.frames = []
+
+    def get_highlight_ranges(self, vcd, limit):
+        self.frames.append(vcd.df)
+        counts = vcd.df.groupby(vcd.df["offset"] // 100 * 100)["message"].count()
+        counts = counts.sort_values(ascending=False, kind="stable")[:limit]
+        return [(start, start + 50, n / len(vcd.df)) for start, n in counts.items()]
+
+
+class CompactChatsTests(TestCase):
+    def build_chats(self, vlen):
+        builder = ChatBuilder()
+
+        for i in range(vlen // 3):
+            offset = i * 3 + (i % 7) * 0.001
+            builder.append(
+                str(i), offset, f"user{i % 13}", f"message {i % (i % 50 + 1)}"
+            )
+
+        return builder
+
+    def predict(self, builder, vlen, compact):
+        predictor = RecordingPredictor()
+        windowed = WindowedPredictor(predictor, 1000, 100, 0.5)
+        df = builder.to_frame(compact).drop("id", axis=1)
+
+        ranges = windowed.get_highlight_ranges(VideoChatsData(1, vlen, df), 5)
+        return ranges, predictor.frames
+
+    def test_predictor_is_given_the_same_chats(self):
+        for vlen in (900, 5000):
+            builder = self.build_chats(vlen)
+            ranges, frames = self.predict(builder, vlen, compact=False)
+            compact_ranges, compact_frames = self.predict(builder, vlen, compact=True)
+
+            self.assertEqual(compact_ranges, ranges)
+            self.assertEqual(len(compact_frames), len(frames))
+
+            for compact_df, df in zip(compact_frames, frames):
+                # Newer pandas infer a string dtype for the object columns.
+                pd.testing.assert_frame_equal(compact_df, df, check_dtype=False)
+                self.assertEqual(compact_df["offset"].dtype, "float64")
+                self.assertFalse(
+                    isinstance(compact_df["user"].dtype, pd.CategoricalDtype)
+                )
+
+    def test_stored_offsets_are_seconds(self):
+        builder = self.build_chats(5000)
+        df = builder.to_frame(compact=True).drop("id", axis=1)
+        self.assertEqual(df["offset"].dtype, "int32")
+
+        with tempfile.TemporaryDirectory() as root:
+            store = ChatLogStore(root, 2 ** 30, "uncompressed", 1000, compact=True)
+            store.save(1, 900, df[df["offset"] < 900_000])
+
+            with store.writer(2, 5000) as write:
+                write(df[df["offset"] < 2_000_000])
+                write(df[df["offset"] >= 2_000_000])
+
+            plain = ChatLogStore(root, 2 ** 30, "uncompressed", 1000, compact=False)
+            expected = builder.to_frame(compact=False)["offset"]
+
+            short = plain.load(1).df["offset"]
+            self.assertEqual(short.tolist(), expected[expected < 900].tolist())
+            self.assertEqual(store.load(1).df["offset"].dtype, "int32")
+
+            stored = pd.concat(plain.load(2).frames(), ignore_index=True)
+            self.assertEqual(stored["offset"].tolist(), expected.tolist())
+
+
+class ChatLogStoreTests(TestCase):
+    def test_load_closes_the_log_on_error(self):
+        sources = []
+        open_map = pa.memory_map
+
+        def memory_map(path):
+            sources.append(open_map(path))
+            return sources[-1]
+
+        with tempfile.TemporaryDirectory() as root:
+            store = ChatLogStore(root, 2 ** 30, "uncompressed", 1000, compact=True)
+            store.save(1, 100, pd.DataFrame({"offset": [1.5], "user": ["a"]}))
+
+            with mock.patch("highlighter_api.chatstore.pa.memory_map", memory_map):
+                with mock.patch("os.utime", side_effect=PermissionError):
+                    with self.assertRaises(PermissionError):
+                        store.load(1)
+
+        self.assertTrue(sources[0].closed)
+
+
+class AsyncCrawlTests(TestCase):
+    def test_store_is_not_used_on_the_event_loop(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+
+        store = ChatLogStore(root.name, 2 ** 30, "uncompressed", 1000, compact=True)
+        threads = []
+
+        def record(fn):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return fn(*args, **kwargs)
+
+            return wrapper
+
+        for name in ("save", "_evict"):
+            setattr(store, name, record(getattr(store, name)))
+
+        writer = store.writer
+
+        @contextlib.contextmanager
+        def recording_writer(vid, vlen):
+            threads.append(threading.current_thread())
+
+            with writer(vid, vlen) as write:
+                yield write
+
+            threads.append(threading.current_thread())
+
+        store.writer = recording_writer
+
+        async def fetch_segment(vid, start, end):
+            builder = ChatBuilder()
+            builder.append(str(start), start, "user", "message")
+            return builder.to_frame(compact=True)
+
+        for vlen in (900, 5000):
+
+            async def get_duration(vid):
+                return vlen
+
+            with mock.patch.multiple(
+                aio,
+                chat_store=store,
+                concat_chats=record(aio.concat_chats),
+                fetch_segment=fetch_segment,
+                get_duration=get_duration,
+            ):
+                asyncio.run(aio.fetch_video_chats(vlen))
+
+            self.assertTrue(store.path(vlen).exists())
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+class OverlappingPredictor:
+    """Returns each range twice, the second copy shifted by 10 seconds."""
+
+    def get_highlight_ranges(self, vcd, limit):
+        ranges = []
+
+        for i in range(limit):
+            start = i // 2 * 100 + i % 2 * 10
+            ranges.append((start, start + 50, 1 - i / 100))
+
+        return ranges[:limit]
+
+
+class RangeSelectionTests(TestCase):
+    def get_ranges(self, vlen, limit):
+        predictor = WindowedPredictor(OverlappingPredictor(), 1000, 100, 0.5)
+        df = pd.DataFrame({"offset": [float(i) for i in range(vlen)]})
+        return predictor.get_highlight_ranges(VideoChatsData(1, vlen, df), limit)
+
+    def test_overlapping_ranges_are_left_out(self):
+        # In one pass and in windows.
+        for vlen in (900, 5000):
+            ranges = self.get_ranges(vlen, 5)
+
+            self.assertEqual(len(ranges), 5)
+            self.assertEqual([r[0] % 100 for r in ranges], [0] * 5)
+            self.assertEqual([r[2] for r in ranges], sorted(r[2] for r in ranges)[::-1])
+
+
+def get_sample(lines, name):
+    for line in lines:
+        if line.startswith(name + " "):
+            return float(line.split()[-1])
+
+    return None
+
+
+def count_in_other_process():
+    metrics.requests_total.inc("other", "GET", 200, amount=3)
+    metrics.shared.write()
+
+
+@override_settings(HIGHLIGHTER_METRICS_TOKEN="token")
+class SharedMetricsTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+
+        # Snapshots are written by the tests rather than every interval.
+        shared = metrics.SharedMetrics(self.root, 5)
+        shared.start = mock.Mock()
+
+        patcher = mock.patch.object(metrics, "shared", shared)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_metrics(self):
+        res = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer token")
+        self.assertEqual(res.status_code, 200)
+        return res.content.decode().splitlines()
+
+    def test_processes_are_merged(self):
+        name = 'highlighter_requests_total{route="other",method="GET",status="200"}'
+        metrics.requests_total.inc("other", "GET", 200, amount=2)
+        before = get_sample(metrics.collect(), name)
+
+        # The child does not count those of this process again.
+        process = multiprocessing.get_context("fork").Process(
+            target=count_in_other_process
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(get_sample(self.get_metrics(), name), before + 3)
+
+    def test_gauges_of_stopped_processes_are_left_out(self):
+        path = os.path.join(self.root, "1.json")
+
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "highlighter_crawls_running": [[[], 4]],
+                    "highlighter_chat_store_requests_total": [[["hit"], 7]],
+                },
+                f,
+            )
+
+        running = get_sample(metrics.collect(), "highlighter_crawls_running")
+        hits = 'highlighter_chat_store_requests_total{result="hit"}'
+        own_hits = get_sample(metrics.collect(), hits) or 0
+
+        old = time.time() - 60
+        os.utime(path, (old, old))
+        lines = self.get_metrics()
+
+        self.assertEqual(running, 4)
+        self.assertEqual(get_sample(lines, "highlighter_crawls_running"), 0)
+        self.assertEqual(get_sample(lines, hits), own_hits)
+
+
+class ResultCacheTests(TestCase):
+    def test_batch_replaces_partial_results(self):
+        Video.objects.create(id=1, duration=3600)
+        Video.objects.create(id=2, duration=3600)
+        cache = HighlightResultCache(settings.HIGHLIGHTER_RESULT_VERSION, 10, 100, 0)
+        cache.put(1, RANGES[5:], progress=0.5)
+
+        cache.put_many({1: RANGES, 2: RANGES})
+
+        for vid in (1, 2):
+            result = cache.get(vid, 3)
+            self.assertEqual(result.progress, 1.0)
+            self.assertEqual(result.ranges, RANGES[:3])
+
+
+class ResultVersionTests(TestCase):
+    def test_results_of_older_selection_are_dropped(self):
+        Video.objects.create(id=1, duration=3600)
+        HighlightResult.objects.create(
+            video_id=1,
+            model_version=settings.HIGHLIGHTER_MODEL_VERSION,
+            limit=10,
+            ranges=[[0, 30, 0.9], [10, 40, 0.8]],
+        )
+        cache = HighlightResultCache(settings.HIGHLIGHTER_RESULT_VERSION, 10, 100, 0)
+
+        self.assertIsNone(cache.get(1, 3))
+
+        Video.objects.create(id=2, duration=3600)
+        cache.put(2, RANGES[:1])
+        self.assertEqual(
+            list(HighlightResult.objects.values_list("model_version", flat=True)),
+            [settings.HIGHLIGHTER_RESULT_VERSION],
+        )
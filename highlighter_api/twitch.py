@@ -0,0 +1,170 @@
+import datetime
+import threading
+import time
+import traceback
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from highlighter.utils.fetch import TwitchCrawler
+
+from .models import TwitchToken
+
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+
+
+class TokenManager:
+    """
+    Keeps the app access token of `client_id` in the `TwitchToken` row shared
+    by all workers, and refreshes it in the background `margin` before it
+    expires. Only one process refreshes at a time; the others reuse the row.
+    """
+
+    def __init__(self, client_id, client_secret, margin: datetime.timedelta):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.margin = margin
+
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = None
+        self._thread = None
+
+    def get(self) -> str:
+        with self._lock:
+            if self._is_fresh(self._expires_at):
+                return self._token
+
+        row = TwitchToken.objects.filter(client_id=self.client_id).first()
+
+        if row is not None and self._is_fresh(row.expires_at):
+            self._remember(row)
+            return row.access_token
+
+        return self.refresh()
+
+    def refresh(self, stale=None) -> str:
+        """
+        Fetch a new token unless another worker already did. With `stale`,
+        the token is refreshed if it is still `stale`, regardless of expiry.
+        """
+        TwitchToken.objects.get_or_create(client_id=self.client_id)
+
+        with transaction.atomic():
+            row = TwitchToken.objects.select_for_update().get(client_id=self.client_id)
+
+            expired = stale is not None and row.access_token == stale
+            if expired or not self._is_fresh(row.expires_at):
+                token, expires_in = self.fetch()
+                row.access_token = token
+                row.expires_at = timezone.now() + datetime.timedelta(seconds=expires_in)
+                row.save()
+
+        self._remember(row)
+        return row.access_token
+
+    def fetch(self):
+        res = requests.post(
+            TOKEN_URL,
+            params={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            },
+            timeout=10,
+        )
+        res.raise_for_status()
+        data = res.json()
+        return data["access_token"], data["expires_in"]
+
+    def start(self):
+        """Start refreshing the token in the background."""
+        if not self.client_id or not self.client_secret:
+            return
+
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run, name="twitch-token", daemon=True
+            )
+            self._thread.start()
+
+    def _is_fresh(self, expires_at):
+        return expires_at is not None and expires_at - self.margin > timezone.now()
+
+    def _remember(self, row):
+        with self._lock:
+            self._token = row.access_token
+            self._expires_at = row.expires_at
+
+    def _run(self):
+        while True:
+            close_old_connections()
+
+            try:
+                self.get()
+                wait = (self._expires_at - self.margin - timezone.now()).total_seconds()
+            except Exception:
+                traceback.print_exc()
+                wait = 60
+
+            time.sleep(max(wait, 1))
+
+
+def is_unauthorized(e: Exception):
+    response = getattr(e, "response", None)
+    return response is not None and response.status_code == 401
+
+
+def call_with_token(fn):
+    """
+    Call `fn(token)` with a valid token, refreshing the token and retrying
+    once if Twitch rejects it.
+    """
+    token = token_manager.get()
+
+    try:
+        return fn(token)
+    except requests.HTTPError as e:
+        if not is_unauthorized(e):
+            raise
+
+    return fn(token_manager.refresh(stale=token))
+
+
+def call_crawler(fn):
+    """Call `fn(crawler)` with a crawler holding a valid token."""
+    return call_with_token(
+        lambda token: fn(TwitchCrawler(token_manager.client_id, token))
+    )
+
+
+def helix_get(path: str, params):
+    def get(token):
+        res = requests.get(
+            f"{settings.TWITCH_API_URL}/helix/{path}",
+            params=params,
+            headers={
+                "Client-Id": token_manager.client_id,
+                "Authorization": f"Bearer {token}",
+            },
+            timeout=10,
+        )
+
+        if res.status_code == 404:
+            return {"data": []}
+
+        res.raise_for_status()
+        return res.json()
+
+    return call_with_token(get)
+
+
+token_manager = TokenManager(
+    settings.TWITCH_CLIENT_ID,
+    settings.TWITCH_CLIENT_SECRET,
+    settings.HIGHLIGHTER_TOKEN_REFRESH_MARGIN,
+)
@@ -7,6 +7,27 @@ urlpatterns = [
         "v1/twitch/<int:vid>",
         views.HighlighterModelView.as_view(),
     ),
+    path(
+        "v1/twitch/<int:vid>/ranges",
+        views.HighlightRangesView.as_view(),
+    ),
+    path(
+        "v1/twitch/<int:vid>/votes",
+        views.HighlightVotesView.as_view(),
+    ),
+    path(
+        "v1/twitch/async/<int:vid>",
+        views.highlights_async_view,
+    ),
+    path(
+        "v1/twitch/batch",
+        views.HighlighterBatchView.as_view(),
+    ),
+    path(
+        "v1/twitch/jobs/<int:job_id>",
+        views.CrawlJobView.as_view(),
+        name="highlighter-crawl-job",
+    ),
     path(
         "v1/twitch/vote/<str:action>",
         views.HighlightVoteView.as_view(),
@@ -0,0 +1,366 @@
+import atexit
+import threading
+import time
+import traceback
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from app import metrics
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from .models import HighlightRange, UserVote
+
+VoteState = namedtuple("VoteState", ["vote_type", "upvotes", "downvotes"])
+
+NO_VOTES = VoteState(None, 0, 0)
+
+VOTE_NOTICES = {
+    UserVote.VoteType.UPVOTE: "Upvoted this highlight video",
+    UserVote.VoteType.DOWNVOTE: "Downvoted this highlight video",
+}
+
+REMOVE_NOTICES = {
+    UserVote.VoteType.UPVOTE: "Removed from upvoted videos",
+    UserVote.VoteType.DOWNVOTE: "Removed from downvoted videos",
+    None: "Removed from voted videos",
+}
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    return {
+        "range": qn(HighlightRange._meta.db_table),
+        "vote": qn(UserVote._meta.db_table),
+        "end": qn("end"),
+    }
+
+
+def _can_return() -> bool:
+    """Whether the database supports `RETURNING`, which SQLite has since 3.35."""
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35)
+
+    return True
+
+
+def _lock_range(cursor, vid, start, end):
+    """Return the id of the range, locking its row, or `None` if it is missing."""
+    t = _tables()
+    lock = " FOR UPDATE" if connection.features.has_select_for_update else ""
+
+    cursor.execute(
+        f"SELECT id FROM {t['range']} "
+        f"WHERE video_id = %s AND start = %s AND {t['end']} = %s{lock}",
+        [vid, start, end],
+    )
+    row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def _count_deltas(old, new):
+    up = down = 0
+
+    for vote_type, delta in ((old, -1), (new, 1)):
+        if vote_type == UserVote.VoteType.UPVOTE:
+            up += delta
+        elif vote_type == UserVote.VoteType.DOWNVOTE:
+            down += delta
+
+    return up, down
+
+
+def cast_vote(user_id: int, vid: int, start: int, end: int, vote_type) -> str:
+    """
+    Upsert the highlight range and the vote of `user_id` without reading the
+    video or the range first. The range upsert locks the range row, so votes
+    on the same range are applied one at a time and the counters stay exact.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        _upsert_vote(cursor, user_id, vid, start, end, vote_type)
+
+    return VOTE_NOTICES[vote_type]
+
+
+def remove_vote(user_id: int, vid: int, start: int, end: int) -> str:
+    with transaction.atomic(), connection.cursor() as cursor:
+        old = _delete_vote(cursor, user_id, vid, start, end)
+
+    return REMOVE_NOTICES[old]
+
+
+def apply_votes(votes):
+    """
+    Apply `{(user_id, vid, start, end): vote_type}` in one transaction, where
+    a `None` vote type removes the vote.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for key, vote_type in votes.items():
+            if vote_type is None:
+                _delete_vote(cursor, *key)
+            else:
+                _upsert_vote(cursor, *key, vote_type)
+
+
+def _upsert_vote(cursor, user_id, vid, start, end, vote_type):
+    t = _tables()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    # The no-op update locks the row of an existing range.
+    upsert = (
+        f"INSERT INTO {t['range']} (video_id, start, {t['end']}, upvotes, downvotes) "
+        f"VALUES (%s, %s, %s, 0, 0) "
+        f"ON CONFLICT (video_id, start, {t['end']}) "
+        f"DO UPDATE SET upvotes = {t['range']}.upvotes"
+    )
+
+    if _can_return():
+        cursor.execute(upsert + " RETURNING id", [vid, start, end])
+        (range_id,) = cursor.fetchone()
+    else:
+        cursor.execute(upsert, [vid, start, end])
+        range_id = _lock_range(cursor, vid, start, end)
+
+    cursor.execute(
+        f"SELECT vote_type FROM {t['vote']} "
+        f"WHERE user_id = %s AND highlight_range_id = %s",
+        [user_id, range_id],
+    )
+    row = cursor.fetchone()
+    old = row[0] if row is not None else None
+
+    if old != vote_type:
+        cursor.execute(
+            f"INSERT INTO {t['vote']} "
+            f"(user_id, highlight_range_id, vote_type, created_at, updated_at) "
+            f"VALUES (%s, %s, %s, %s, %s) "
+            f"ON CONFLICT (user_id, highlight_range_id) "
+            f"DO UPDATE SET vote_type = excluded.vote_type, "
+            f"updated_at = excluded.updated_at",
+            [user_id, range_id, vote_type, now, now],
+        )
+        _update_counts(cursor, range_id, old, vote_type)
+
+    return old
+
+
+def _delete_vote(cursor, user_id, vid, start, end):
+    t = _tables()
+
+    # Lock the range before the vote, in the same order as `_upsert_vote`,
+    # so a removal and a vote of the same user cannot deadlock.
+    range_id = _lock_range(cursor, vid, start, end)
+
+    if range_id is None:
+        return None
+
+    where = "WHERE user_id = %s AND highlight_range_id = %s"
+
+    if _can_return():
+        cursor.execute(
+            f"DELETE FROM {t['vote']} {where} RETURNING vote_type",
+            [user_id, range_id],
+        )
+        row = cursor.fetchone()
+    else:
+        cursor.execute(
+            f"SELECT vote_type FROM {t['vote']} {where}", [user_id, range_id]
+        )
+        row = cursor.fetchone()
+
+        if row is not None:
+            cursor.execute(f"DELETE FROM {t['vote']} {where}", [user_id, range_id])
+
+    if row is None:
+        return None
+
+    (old,) = row
+    _update_counts(cursor, range_id, old, None)
+    return old
+
+
+def _update_counts(cursor, range_id, old, new):
+    up, down = _count_deltas(old, new)
+    t = _tables()
+
+    cursor.execute(
+        f"UPDATE {t['range']} SET upvotes = upvotes + %s, downvotes = downvotes + %s "
+        f"WHERE id = %s",
+        [up, down, range_id],
+    )
+
+
+def get_vote(user_id: int, vid: int, start: int, end: int):
+    """Return the stored vote type of `user_id` on a range, or `None`."""
+    return (
+        UserVote.objects.filter(
+            user_id=user_id,
+            highlight_range__video_id=vid,
+            highlight_range__start=start,
+            highlight_range__end=end,
+        )
+        .values_list("vote_type", flat=True)
+        .first()
+    )
+
+
+@metrics.timed("votes")
+def get_vote_states(user_id: int, ranges_by_vid):
+    """
+    Return `{(vid, start, end): VoteState}` for the exact `(start, end)` pairs
+    in `ranges_by_vid` (`{vid: [(start, end, ...)]}`), holding the vote of
+    `user_id` and the stored counters, using a single query. Ranges nobody
+    voted on are missing from the result.
+    """
+    pairs = [
+        Q(video_id=vid, start=r[0], end=r[1])
+        for vid, ranges in ranges_by_vid.items()
+        for r in ranges
+    ]
+
+    if not pairs:
+        return {}
+
+    rows = (
+        HighlightRange.objects.annotate(
+            user_vote=FilteredRelation(
+                "highlight_range_votes",
+                condition=Q(highlight_range_votes__user_id=user_id),
+            )
+        )
+        .filter(reduce(or_, pairs))
+        .values_list(
+            "video_id", "start", "end", "user_vote__vote_type", "upvotes", "downvotes"
+        )
+    )
+
+    states = {
+        (vid, start, end): VoteState(vote_type, upvotes, downvotes)
+        for vid, start, end, vote_type, upvotes, downvotes in rows
+    }
+
+    if settings.HIGHLIGHTER_VOTE_BUFFER:
+        vote_buffer.overlay(user_id, ranges_by_vid, states)
+
+    return states
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for votes. The last vote of each (user, range) wins
+    and a background thread applies the buffered votes every `interval`
+    seconds in a single transaction. Votes a database error kept from being
+    written are retried on the next flush.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._thread = None
+
+    def add(self, user_id: int, vid: int, start: int, end: int, vote_type):
+        with self._lock:
+            self._pending[(user_id, vid, start, end)] = vote_type
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="vote-buffer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def pending(self, user_id: int, vid: int, start: int, end: int):
+        """Return `(True, vote_type)` if a vote is waiting to be written."""
+        key = (user_id, vid, start, end)
+
+        with self._lock:
+            for votes in (self._pending, self._flushing):
+                if key in votes:
+                    return True, votes[key]
+
+        return False, None
+
+    def overlay(self, user_id: int, ranges_by_vid, states):
+        """Apply the unflushed votes of `user_id` to `states` in place."""
+        with self._lock:
+            pending = {
+                key[1:]: vote_type
+                for votes in (self._flushing, self._pending)
+                for key, vote_type in votes.items()
+                if key[0] == user_id
+            }
+
+        if not pending:
+            return
+
+        for vid, ranges in ranges_by_vid.items():
+            for r in ranges:
+                key = (vid, r[0], r[1])
+
+                if key not in pending:
+                    continue
+
+                vote_type = pending[key]
+                state = states.get(key, NO_VOTES)
+
+                up, down = _count_deltas(state.vote_type, vote_type)
+                states[key] = VoteState(
+                    vote_type, state.upvotes + up, state.downvotes + down
+                )
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                votes = self._flushing = self._pending
+                self._pending = {}
+
+            if not votes:
+                return
+
+            try:
+                try:
+                    apply_votes(votes)
+                except IntegrityError:
+                    # A vote refers to a deleted video; keep the others.
+                    for key, vote_type in votes.items():
+                        try:
+                            apply_votes({key: vote_type})
+                        except IntegrityError as e:
+                            print(f"[Vote] dropped {key}: {e}")
+            except DatabaseError as e:
+                # Retried on the next flush. Applying a vote again is a no-op,
+                # and votes cast meanwhile replace the failed ones.
+                print(f"[Vote] flush of {len(votes)} votes failed: {e}")
+
+                with self._lock:
+                    for key, vote_type in votes.items():
+                        self._pending.setdefault(key, vote_type)
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+
+vote_buffer = VoteBuffer(settings.HIGHLIGHTER_VOTE_FLUSH_INTERVAL)
@@ -0,0 +1,113 @@
+import pandas as pd
+from highlighter.utils.load import VideoChatsData
+
+from .chats import concat_chats, expand_chats, to_offset
+from .chatstore import StoredVideoChats
+from .selection import select_ranges
+
+
+def iter_windows(frames, vlen: int, size: int, overlap: int):
+    """
+    Regroup chat `frames` in offset order into `(start, end, df)` windows of
+    `size` seconds, each extended by `overlap` seconds into the next one. The
+    last window ends at `vlen`. Only the chats of the current window are
+    held, however long the video is.
+    """
+    start = 0
+    pending = []
+
+    def split(end):
+        df = concat_chats(pending)
+        offsets = df["offset"]
+        return (
+            df[offsets < to_offset(df, end)],
+            df[offsets >= to_offset(df, start + size)],
+        )
+
+    for frame in frames:
+        pending.append(frame)
+
+        while (
+            start + size + overlap < vlen
+            and not frame.empty
+            and frame["offset"].iloc[-1] >= to_offset(frame, start + size + overlap)
+        ):
+            window, rest = split(start + size + overlap)
+            yield start, start + size + overlap, window
+
+            start += size
+            pending = [rest]
+
+    while True:
+        end = min(start + size + overlap, vlen)
+
+        if not pending:
+            yield start, end, pd.DataFrame()
+        else:
+            window, rest = split(end)
+            yield start, end, window
+            pending = [rest]
+
+        if end >= vlen:
+            return
+
+        start += size
+
+
+class WindowedPredictor:
+    """
+    Wraps the predictor to bound the chats it is given. Videos up to `size`
+    seconds (plus `overlap`) are predicted in one pass as before. Longer ones
+    are predicted window by window, each window seeing `overlap` seconds of
+    the next so ranges near its end are not cut, and the top ranges of all
+    windows are merged. A range belongs to the window it starts in. Either
+    way, ranges overlapping a more probable one by more than `max_overlap`,
+    such as one highlight found on both sides of a window boundary, are left
+    out. Compact chats are expanded for the predictor one window at a time.
+    """
+
+    def __init__(self, predictor, size: int, overlap: int, max_overlap: float):
+        self.predictor = predictor
+        self.size = size
+        self.overlap = overlap
+        self.max_overlap = max_overlap
+
+    def get_highlight_ranges(self, vcd, limit: int):
+        if isinstance(vcd, StoredVideoChats):
+            frames = vcd.frames()
+        elif vcd.vlen <= self.size + self.overlap:
+            vcd = VideoChatsData(vcd.vid, vcd.vlen, expand_chats(vcd.df))
+            # Twice the ranges, to replace those suppressed.
+            ranges = self.predictor.get_highlight_ranges(vcd, 2 * limit)
+            return select_ranges(ranges, limit, self.max_overlap)
+        else:
+            frames = [vcd.df.sort_values("offset", kind="stable")]
+
+        candidates = []
+
+        for start, end, df in iter_windows(frames, vcd.vlen, self.size, self.overlap):
+            if df.empty:
+                continue
+
+            # Only one window of expanded chats is held at a time.
+            window = VideoChatsData(vcd.vid, end - start, expand_chats(df, start))
+
+            # Twice the ranges, to replace those suppressed when merging.
+            for r in self._predict_window(window, 2 * limit, last=end >= vcd.vlen):
+                candidates.append((r[0] + start, r[1] + start, *r[2:]))
+
+        return select_ranges(candidates, limit, self.max_overlap)
+
+    def _predict_window(self, window, limit: int, last: bool):
+        """Return the top `limit` ranges starting in `window` before its overlap."""
+        n = limit
+
+        while True:
+            ranges = self.predictor.get_highlight_ranges(window, n)
+            owned = [r for r in ranges if last or r[0] < self.size]
+
+            # Ranges in the overlap may have taken the place of owned ones.
+            if len(owned) >= limit or len(ranges) < n:
+                return owned[:limit]
+
+            n *= 2